@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
+import io
 import os
+import gc
+import json
+import time
+import hashlib
 import tempfile
+import threading
+import contextlib
+import http.client
+from collections import OrderedDict
+from concurrent.futures import Future
+import urllib.parse
 import urllib.request
 import urllib.error
 from fastmcp import FastMCP
 from dotenv import load_dotenv
-import whisper
 
 # Load environment variables
 load_dotenv()
@@ -16,17 +26,428 @@ mcp = FastMCP("Audio Transcriber")
 # Supported audio formats
 SUPPORTED_FORMATS = {'.opus', '.ogg', '.m4a', '.mp3', '.wav', '.webm', '.flac', '.aac'}
 
-# Cache the model to avoid reloading on each request
-_model = None
+# Memory budget for loaded Whisper models, in MB. Least recently used models are unloaded to stay within it.
+MODEL_MEMORY_MB = int(os.environ.get("WHISPER_MODEL_MEMORY_MB", "4096"))
+# Set WHISPER_WARMUP=1 to load WHISPER_MODEL in the background as soon as the server starts.
+WARMUP_ENABLED = os.environ.get("WHISPER_WARMUP", "0") == "1"
+
+# Transcriptions are cached here, keyed by the audio content, model and options.
+CACHE_DIR = os.environ.get("WHISPER_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "mcptools", "transcriptions"
+)
+# Maximum total size of the transcription cache in bytes (0 disables it).
+CACHE_MAX_BYTES = int(os.environ.get("WHISPER_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# Largest audio file transcribe_audio downloads, in bytes.
+MAX_DOWNLOAD_BYTES = int(os.environ.get("WHISPER_MAX_DOWNLOAD_BYTES", str(500 * 1024 * 1024)))
+# Bytes read from the response and written to the temporary file at a time.
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Idle keep-alive connections kept per host for downloads, and seconds before one is closed.
+POOL_SIZE = int(os.environ.get("WHISPER_POOL_SIZE", "4"))
+POOL_IDLE_TIMEOUT = float(os.environ.get("WHISPER_POOL_IDLE_TIMEOUT", "60"))
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Approximate memory use of each model in MB, used to make room before a model is loaded.
+MODEL_SIZES_MB = {
+    "tiny.en": 150, "tiny": 150, "base.en": 300, "base": 300, "small.en": 1000, "small": 1000,
+    "medium.en": 3100, "medium": 3100, "large": 6200,
+    "large-v1": 6200, "large-v2": 6200, "large-v3": 6200, "large-v3-turbo": 3300, "turbo": 3300,
+}
+
+# Room made before loading a model missing from MODEL_SIZES_MB (a checkpoint path or a newer model):
+# as much as the largest known model.
+UNKNOWN_MODEL_SIZE_MB = max(MODEL_SIZES_MB.values())
+
+
+def default_model_name() -> str:
+    """Returns the model used when a tool call does not name one."""
+    return os.environ.get("WHISPER_MODEL", "base")
+
+
+def check_model_name(model_name: str = None) -> str:
+    """
+    Returns the model to use for a tool call: model_name, or WHISPER_MODEL if it is not given.
+    whisper.load_model also accepts a checkpoint path, which it unpickles with torch.load, so a name
+    from a tool call must be an official Whisper model or WHISPER_MODEL; ValueError otherwise.
+    WHISPER_MODEL itself is set by the operator and may be any name or path Whisper accepts.
+    """
+    default = default_model_name()
+    if model_name and model_name != default and model_name not in MODEL_SIZES_MB:
+        raise ValueError(f"unknown model '{model_name}'. Available models: {', '.join(MODEL_SIZES_MB)}")
+    return model_name or default
+
+
+def load_whisper_model(model_name: str):
+    """Loads a Whisper model by name."""
+    # whisper pulls in torch and numba, which take seconds and hundreds of MB to import, so it is
+    # only imported once a model is needed; the server can start and list its tools without it.
+    import whisper
+    return whisper.load_model(model_name)
+
+
+def model_size_mb(model) -> float:
+    """Returns the memory taken by a model's parameters and buffers in MB."""
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors) / (1024 * 1024)
+
+
+class ModelRegistry:
+    """
+    Loaded Whisper models keyed by name, kept within a memory budget by unloading the least recently
+    used ones. Concurrent requests for a model that is still loading wait for that load instead of
+    starting another one.
+    """
+
+    def __init__(self, budget_mb: float, loader=load_whisper_model, sizer=model_size_mb):
+        self.budget_mb = budget_mb
+        self.loader = loader
+        self.sizer = sizer
+        # name -> (model, size in MB), least recently used first
+        self._models = OrderedDict()
+        # name -> Future of a load in progress
+        self._loading = {}
+        # name -> error of the last failed load
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str):
+        with self._lock:
+            if model_name in self._models:
+                self._models.move_to_end(model_name)
+                return self._models[model_name][0]
+            future = self._loading.get(model_name)
+            loading_here = future is None
+            if loading_here:
+                future = self._loading[model_name] = Future()
+        if not loading_here:
+            return future.result()
+
+        try:
+            with self._lock:
+                self._evict(MODEL_SIZES_MB.get(model_name, UNKNOWN_MODEL_SIZE_MB))
+            model = self.loader(model_name)
+            size = self.sizer(model)
+            with self._lock:
+                self._models[model_name] = (model, size)
+                self._failed.pop(model_name, None)
+                self._evict(0, keep=model_name)
+            future.set_result(model)
+            return model
+        except BaseException as e:
+            with self._lock:
+                self._failed[model_name] = str(e) or type(e).__name__
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(model_name, None)
+
+    def _evict(self, needed_mb: float, keep: str = None):
+        """Unloads least recently used models until needed_mb more fits in the budget. Call with the lock held."""
+        evicted = False
+        for name in list(self._models):
+            if sum(size for _, size in self._models.values()) + needed_mb <= self.budget_mb:
+                break
+            if name != keep:
+                del self._models[name]
+                evicted = True
+        if evicted:
+            gc.collect()
+
+    def status(self, model_name: str) -> dict:
+        """Returns {"state": "loading" | "ready" | "failed" | "not loaded"} for a model, with its size or error."""
+        with self._lock:
+            if model_name in self._loading:
+                return {"state": "loading"}
+            if model_name in self._models:
+                return {"state": "ready", "size_mb": round(self._models[model_name][1], 1)}
+            if model_name in self._failed:
+                return {"state": "failed", "error": self._failed[model_name]}
+            return {"state": "not loaded"}
+
+    def known(self) -> list:
+        """Returns the names of all models that are loaded, loading or failed."""
+        with self._lock:
+            return list(dict.fromkeys([*self._models, *self._loading, *self._failed]))
+
+    def loaded(self) -> dict:
+        """Returns the loaded models and their sizes in MB, least recently used first."""
+        with self._lock:
+            return {name: size for name, (_, size) in self._models.items()}
+
+
+models = ModelRegistry(MODEL_MEMORY_MB)
+
 
 def get_model(model_name: str = None):
-    """Get or load the Whisper model."""
-    global _model
-    if model_name is None:
-        model_name = os.environ.get("WHISPER_MODEL", "base")
-    if _model is None:
-        _model = whisper.load_model(model_name)
-    return _model
+    """Get or load a Whisper model (WHISPER_MODEL by default)."""
+    return models.get(check_model_name(model_name))
+
+
+def start_warmup() -> threading.Thread:
+    """Loads WHISPER_MODEL in a background thread; tool calls that need it wait for this load."""
+    def warm_up():
+        try:
+            get_model()
+        except Exception:
+            # The error is kept by the registry and reported by whisper_model_status.
+            pass
+
+    thread = threading.Thread(target=warm_up, name="whisper-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def file_sha256(path: str) -> str:
+    """Returns the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TranscriptionCache:
+    """
+    Transcription results (text and segments) stored as one JSON file per audio content, model and
+    options. The least recently used results are removed once the total size exceeds max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def key(self, audio_sha256: str, model_name: str, options: dict) -> str:
+        return hashlib.sha256(json.dumps([audio_sha256, model_name, options], sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _write(self, path: str, entry: dict):
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(temp_path, path)
+
+    def get(self, key: str) -> dict:
+        """Returns the cached result for key, or None."""
+        if self.max_bytes <= 0:
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self._lock:
+            try:
+                self._write(path, dict(entry, last_used=time.time()))
+            except OSError:
+                pass
+        return entry
+
+    def put(self, key: str, result: dict):
+        """Stores the text and segments of a Whisper result."""
+        if self.max_bytes <= 0:
+            return
+        entry = {
+            "text": result["text"],
+            "segments": [
+                {field: segment[field] for field in ("id", "start", "end", "text") if field in segment}
+                for segment in result.get("segments", [])
+            ],
+            "last_used": time.time(),
+        }
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self._write(self._path(key), entry)
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                size = os.path.getsize(path)
+                with open(path) as f:
+                    last_used = json.load(f).get("last_used", 0)
+            except (OSError, ValueError):
+                continue
+            entries.append((last_used, size, path))
+            total += size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+transcriptions = TranscriptionCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+
+def transcribe_file(path: str, language: str = None, model: str = None) -> str:
+    """
+    Transcribes an audio file and returns the tool response. Results are cached by audio content,
+    model and options, and the cache is checked before the model is loaded.
+    """
+    model_name = check_model_name(model)
+
+    # Build transcribe options
+    options = {}
+    if language:
+        options["language"] = language
+
+    key = transcriptions.key(file_sha256(path), model_name, options)
+    result = transcriptions.get(key)
+    if result is None:
+        # Load model and transcribe
+        whisper_model = get_model(model_name)
+        result = whisper_model.transcribe(path, **options)
+        transcriptions.put(key, result)
+
+    transcription = result["text"].strip()
+
+    if not transcription:
+        return "Warning: Audio was transcribed but no speech was detected."
+
+    return transcription
+
+
+class DownloadTooLarge(Exception):
+    """The audio file is larger than MAX_DOWNLOAD_BYTES."""
+
+
+class ConnectionPool:
+    """Idle HTTP/1.1 connections per (scheme, host, port), reused by later downloads."""
+
+    def __init__(self, size: int, idle_timeout: float):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        # (scheme, host, port) -> [(connection, time it became idle)], most recent last
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def connect(self, key: tuple) -> http.client.HTTPConnection:
+        """Returns a new connection for key."""
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(host, port)
+
+    def acquire(self, key: tuple) -> tuple[http.client.HTTPConnection, bool]:
+        """Returns a connection for key and whether it was reused."""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                connection, since = idle.pop()
+                if now - since < self.idle_timeout:
+                    return connection, True
+                connection.close()
+        return self.connect(key), False
+
+    def release(self, key: tuple, connection: http.client.HTTPConnection, response: http.client.HTTPResponse):
+        """Keeps the connection if its response was read completely, otherwise closes it."""
+        if response.isclosed() and not response.will_close:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.size:
+                    idle.append((connection, time.monotonic()))
+                    return
+        response.close()
+        connection.close()
+
+    def clear(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle = [connection for connections in self._idle.values() for connection, _ in connections]
+            self._idle.clear()
+        for connection in idle:
+            connection.close()
+
+
+pool = ConnectionPool(POOL_SIZE, POOL_IDLE_TIMEOUT)
+
+
+@contextlib.contextmanager
+def open_url(url: str, headers: dict):
+    """
+    GETs url over a pooled keep-alive connection, following redirects, and yields the response.
+    Raises urllib.error.HTTPError for error statuses. Uses urlopen when a proxy is configured.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme in urllib.request.getproxies() and not urllib.request.proxy_bypass(parts.hostname or ""):
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+            yield response
+        return
+
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise urllib.error.URLError(f"unsupported URL scheme: {parts.scheme}")
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+
+        connection, reused = pool.acquire(key)
+        try:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            if not reused:
+                raise
+            # The server closed the idle connection; retry once on a new one.
+            connection = pool.connect(key)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            connection.close()
+            raise
+
+        try:
+            if response.status in REDIRECT_STATUSES and response.headers.get("Location"):
+                response.read()
+                url = urllib.parse.urljoin(url, response.headers["Location"])
+                continue
+            if response.status >= 400:
+                body = response.read()
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+            yield response
+            return
+        finally:
+            pool.release(key, connection, response)
+    raise urllib.error.URLError(f"too many redirects (more than {MAX_REDIRECTS})")
+
+
+def download_audio(url: str, out_file, max_bytes: int = None) -> int:
+    """
+    Streams url into out_file in chunks and returns the number of bytes written.
+    Raises DownloadTooLarge when Content-Length or the data read exceeds max_bytes.
+    """
+    max_bytes = MAX_DOWNLOAD_BYTES if max_bytes is None else max_bytes
+    headers = {"User-Agent": "MCP-Audio-Transcriber"}
+    size = 0
+    with open_url(url, headers) as response:
+        length = response.headers.get("Content-Length")
+        if max_bytes and length and length.isdigit() and int(length) > max_bytes:
+            raise DownloadTooLarge(f"Audio file is too large ({length} bytes, limit {max_bytes})")
+        while chunk := response.read(DOWNLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if max_bytes and size > max_bytes:
+                raise DownloadTooLarge(f"Audio file is too large (more than {max_bytes} bytes)")
+            out_file.write(chunk)
+    return size
 
 
 def get_file_extension(url: str) -> str:
@@ -38,18 +459,21 @@ def get_file_extension(url: str) -> str:
 
 
 @mcp.tool()
-def transcribe_audio(url: str, language: str = None) -> str:
+def transcribe_audio(url: str, language: str = None, model: str = None, timings: bool = False) -> str:
     """
     Transcribes audio from a URL using OpenAI Whisper.
 
     Args:
         url: URL to the audio file
         language: Optional language code (e.g., 'en', 'es', 'it'). If not provided, Whisper auto-detects.
+        model: Optional Whisper model name (e.g., 'tiny' for a quick pass, 'medium' for accuracy). Defaults to WHISPER_MODEL.
+        timings: If true, appends the download size and time and the transcription time.
 
     Returns:
         The transcribed text from the audio file.
 
     Supported formats: .opus, .ogg, .m4a, .mp3, .wav, .webm, .flac, .aac
+    Files larger than WHISPER_MAX_DOWNLOAD_BYTES are rejected.
 
     Note: For authenticated URLs (e.g., Trello attachments), download the file first
     using the appropriate tool (e.g., trello-downloader) and use transcribe_local_audio.
@@ -59,40 +483,33 @@ def transcribe_audio(url: str, language: str = None) -> str:
         ext = get_file_extension(url)
         if ext and ext not in SUPPORTED_FORMATS:
             return f"Error: Unsupported audio format '{ext}'. Supported formats: {', '.join(sorted(SUPPORTED_FORMATS))}"
-
-        headers = {"User-Agent": "MCP-Audio-Transcriber"}
+        # Reject an unknown model before downloading anything
+        check_model_name(model)
 
         # Download the audio file to a temp location
         with tempfile.NamedTemporaryFile(suffix=ext or '.audio', delete=False) as tmp_file:
             tmp_path = tmp_file.name
 
-            try:
-                req = urllib.request.Request(url, headers=headers)
-                with urllib.request.urlopen(req) as response:
-                    tmp_file.write(response.read())
-            except urllib.error.HTTPError as e:
-                return f"HTTP Error {e.code}: {e.reason}"
-            except urllib.error.URLError as e:
-                return f"URL Error: {e.reason}"
-
         try:
-            # Load model and transcribe
-            model = get_model()
-
-            # Build transcribe options
-            options = {}
-            if language:
-                options["language"] = language
-
-            result = model.transcribe(tmp_path, **options)
-
-            transcription = result["text"].strip()
-
-            if not transcription:
-                return "Warning: Audio was transcribed but no speech was detected."
-
+            started = time.monotonic()
+            with open(tmp_path, "wb") as out_file:
+                size = download_audio(url, out_file)
+            download_seconds = time.monotonic() - started
+
+            started = time.monotonic()
+            transcription = transcribe_file(tmp_path, language, model)
+            transcribe_seconds = time.monotonic() - started
+            if timings:
+                transcription += (f"\n\n[download: {size} bytes in {download_seconds:.2f}s, "
+                                  f"transcription: {transcribe_seconds:.2f}s]")
             return transcription
 
+        except DownloadTooLarge as e:
+            return f"Error: {e}"
+        except urllib.error.HTTPError as e:
+            return f"HTTP Error {e.code}: {e.reason}"
+        except urllib.error.URLError as e:
+            return f"URL Error: {e.reason}"
         finally:
             # Clean up temp file
             if os.path.exists(tmp_path):
@@ -103,13 +520,14 @@ def transcribe_audio(url: str, language: str = None) -> str:
 
 
 @mcp.tool()
-def transcribe_local_audio(file_path: str, language: str = None) -> str:
+def transcribe_local_audio(file_path: str, language: str = None, model: str = None) -> str:
     """
     Transcribes a local audio file using OpenAI Whisper.
 
     Args:
         file_path: Path to the local audio file
         language: Optional language code (e.g., 'en', 'es', 'it'). If not provided, Whisper auto-detects.
+        model: Optional Whisper model name (e.g., 'tiny' for a quick pass, 'medium' for accuracy). Defaults to WHISPER_MODEL.
 
     Returns:
         The transcribed text from the audio file.
@@ -124,26 +542,29 @@ def transcribe_local_audio(file_path: str, language: str = None) -> str:
         if ext and ext not in SUPPORTED_FORMATS:
             return f"Error: Unsupported audio format '{ext}'. Supported formats: {', '.join(sorted(SUPPORTED_FORMATS))}"
 
-        # Load model and transcribe
-        model = get_model()
-
-        # Build transcribe options
-        options = {}
-        if language:
-            options["language"] = language
-
-        result = model.transcribe(file_path, **options)
-
-        transcription = result["text"].strip()
-
-        if not transcription:
-            return "Warning: Audio was transcribed but no speech was detected."
-
-        return transcription
+        return transcribe_file(file_path, language, model)
 
     except Exception as e:
         return f"Error: {e}"
 
 
+@mcp.tool()
+def whisper_model_status() -> str:
+    """
+    Reports the Whisper models as JSON: for the default model (WHISPER_MODEL) and every other model
+    used so far, whether it is "loading", "ready" (with its size in MB), "failed" (with the error)
+    or "not loaded".
+    """
+    names = list(dict.fromkeys([default_model_name(), *models.known()]))
+    return json.dumps({
+        "default_model": default_model_name(),
+        "warmup": WARMUP_ENABLED,
+        "memory_budget_mb": models.budget_mb,
+        "models": {name: models.status(name) for name in names},
+    }, indent=2)
+
+
 if __name__ == "__main__":
+    if WARMUP_ENABLED:
+        start_warmup()
     mcp.run(show_banner=False)
@@ -1,9 +1,14 @@
 import sys
 import os
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, call
 import asyncio
 import tempfile
+import subprocess
+import json
+import threading
+import http.server
+import time
 
 # Add current directory to path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -11,6 +16,9 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 # Import the actual module, not the package
 from audio_transcriber import audio_transcriber as tool_module
 
+# Keep the transcription cache out of the user's home directory
+tool_module.transcriptions.directory = tempfile.mkdtemp(prefix="transcription-cache-test-")
+
 
 def get_text(result):
     text = ""
@@ -23,6 +31,16 @@ def get_text(result):
 
 class TestAudioTranscriber(unittest.TestCase):
 
+    def setUp(self):
+        # Several tests transcribe the same bytes; give each one an empty transcription cache
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache_patch = patch.object(tool_module.transcriptions, "directory", self.cache_dir.name)
+        self.cache_patch.start()
+
+    def tearDown(self):
+        self.cache_patch.stop()
+        self.cache_dir.cleanup()
+
     def test_get_file_extension(self):
         """Test file extension extraction from URLs."""
         self.assertEqual(tool_module.get_file_extension("https://example.com/audio.mp3"), ".mp3")
@@ -65,15 +83,15 @@ class TestAudioTranscriber(unittest.TestCase):
         finally:
             os.remove(tmp_path)
 
-    @patch("urllib.request.urlopen")
+    @patch.object(tool_module, "open_url")
     @patch.object(tool_module, "get_model")
-    def test_transcribe_url_success(self, mock_get_model, mock_urlopen):
+    def test_transcribe_url_success(self, mock_get_model, mock_open_url):
         """Test successful transcription from URL."""
         # Mock URL response
         mock_response = MagicMock()
-        mock_response.__enter__.return_value = mock_response
-        mock_response.read.return_value = b"fake audio data"
-        mock_urlopen.return_value = mock_response
+        mock_response.headers = {}
+        mock_response.read.side_effect = [b"fake audio data", b""]
+        mock_open_url.return_value.__enter__.return_value = mock_response
 
         # Mock Whisper model
         mock_model = MagicMock()
@@ -163,6 +181,375 @@ class TestAudioTranscriber(unittest.TestCase):
         finally:
             os.remove(tmp_path)
 
+    @patch.object(tool_module, "get_model")
+    def test_transcribe_with_model(self, mock_get_model):
+        """Test that the model parameter selects the Whisper model."""
+        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as f:
+            f.write(b"fake audio data")
+            tmp_path = f.name
+
+        try:
+            mock_get_model.return_value.transcribe.return_value = {"text": "Quick pass."}
+
+            res = asyncio.run(tool_module.transcribe_local_audio.run({
+                "file_path": tmp_path,
+                "model": "tiny"
+            }))
+
+            self.assertEqual(get_text(res), "Quick pass.")
+            mock_get_model.assert_called_once_with("tiny")
+            print("\nPASSED: Transcribe with model test")
+        finally:
+            os.remove(tmp_path)
+
+    @patch.object(tool_module, "get_model")
+    def test_transcription_cache(self, mock_get_model):
+        """Test that repeated transcriptions of the same audio come from the cache."""
+        mock_model = mock_get_model.return_value
+        mock_model.transcribe.return_value = {
+            "text": " Cached note.",
+            "segments": [{"id": 0, "start": 0.0, "end": 1.5, "text": " Cached note.", "tokens": [1, 2]}],
+        }
+        paths = []
+        for _ in range(2):
+            with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as f:
+                f.write(b"same voice note")
+                paths.append(f.name)
+
+        try:
+            def transcribe(path, **args):
+                return get_text(asyncio.run(tool_module.transcribe_local_audio.run(dict(file_path=path, **args))))
+
+            self.assertEqual(transcribe(paths[0]), "Cached note.")
+            started = time.perf_counter()
+            # Same content under another name: served from the cache without loading the model
+            self.assertEqual(transcribe(paths[1]), "Cached note.")
+            self.assertLess(time.perf_counter() - started, 0.5)
+            self.assertEqual(mock_get_model.call_count, 1)
+
+            # Another language or model is a different entry
+            transcribe(paths[0], language="en")
+            transcribe(paths[0], model="tiny")
+            self.assertEqual(mock_model.transcribe.call_count, 3)
+
+            entries = os.listdir(self.cache_dir.name)
+            self.assertEqual(len(entries), 3)
+            with open(os.path.join(self.cache_dir.name, entries[0])) as f:
+                self.assertEqual(json.load(f)["segments"], [{"id": 0, "start": 0.0, "end": 1.5, "text": " Cached note."}])
+            print("\nPASSED: Transcription cache test")
+        finally:
+            for path in paths:
+                os.remove(path)
+
+    def test_transcription_cache_eviction(self):
+        """Test that the least recently used transcriptions are evicted."""
+        cache = tool_module.TranscriptionCache(self.cache_dir.name, 400)
+        for name in ("a", "b", "c"):
+            cache.put(name, {"text": name * 100})
+            time.sleep(0.01)
+            if name == "b":
+                cache.get("a")
+                time.sleep(0.01)
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertIsNone(tool_module.TranscriptionCache(self.cache_dir.name, 0).get("a"))
+        print("\nPASSED: Transcription cache eviction test")
+
+
+class AudioHandler(http.server.BaseHTTPRequestHandler):
+    """Serves DATA over keep-alive HTTP/1.1, with or without Content-Length."""
+
+    DATA = b"\x00audio" * 5000
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.clients.add(self.client_address)
+        if self.path.startswith("/redirect"):
+            self.send_response(302)
+            self.send_header("Location", "/voice.ogg")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.startswith("/missing"):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.path.startswith("/chunked"):
+            # No Content-Length: the size is only known while reading
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for start in range(0, len(self.DATA), 4096):
+                chunk = self.DATA[start:start + 4096]
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+        self.send_header("Content-Length", str(len(self.DATA)))
+        self.end_headers()
+        self.wfile.write(self.DATA)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestUrlDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), AudioHandler)
+        self.server.clients = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.patches = [patch.object(tool_module.transcriptions, "directory", self.cache_dir.name)]
+        for p in self.patches:
+            p.start()
+        tool_module.pool.clear()
+
+    def tearDown(self):
+        tool_module.pool.clear()
+        for p in self.patches:
+            p.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.cache_dir.cleanup()
+
+    def transcribe(self, path, **args):
+        return get_text(asyncio.run(tool_module.transcribe_audio.run(dict(url=f"{self.base}{path}", **args))))
+
+    @patch.object(tool_module, "get_model")
+    def test_download_streams_and_reuses_connection(self, mock_get_model):
+        """Test that downloads are streamed to disk and reuse the keep-alive connection."""
+        received = []
+        mock_get_model.return_value.transcribe.side_effect = lambda path, **options: (
+            received.append(open(path, "rb").read()) or {"text": "Podcast."}
+        )
+
+        with patch.object(tool_module, "DOWNLOAD_CHUNK_SIZE", 1000):
+            text = self.transcribe("/voice.ogg", timings=True)
+            self.transcribe("/redirect.ogg", model="tiny")
+
+        self.assertTrue(text.startswith(f"Podcast.\n\n[download: {len(AudioHandler.DATA)} bytes in "))
+        self.assertIn("transcription: ", text)
+        self.assertEqual(received, [AudioHandler.DATA, AudioHandler.DATA])
+        self.assertEqual(len(self.server.clients), 1)
+        print("\nPASSED: Streaming download test")
+
+    @patch.object(tool_module, "get_model")
+    def test_download_size_limit(self, mock_get_model):
+        """Test that the size limit is checked against Content-Length and while reading."""
+        with patch.object(tool_module, "MAX_DOWNLOAD_BYTES", 10000):
+            declared = self.transcribe("/voice.ogg")
+            streamed = self.transcribe("/chunked.ogg")
+
+        self.assertEqual(declared, f"Error: Audio file is too large ({len(AudioHandler.DATA)} bytes, limit 10000)")
+        self.assertEqual(streamed, "Error: Audio file is too large (more than 10000 bytes)")
+        mock_get_model.assert_not_called()
+        print("\nPASSED: Download size limit test")
+
+    def test_download_http_error(self):
+        """Test that HTTP errors are reported and the temp file is removed."""
+        before = set(os.listdir(tempfile.gettempdir()))
+        self.assertEqual(self.transcribe("/missing.ogg"), "HTTP Error 404: Not Found")
+        self.assertEqual({name for name in set(os.listdir(tempfile.gettempdir())) - before if name.endswith(".ogg")}, set())
+        print("\nPASSED: Download HTTP error test")
+
+
+class TestModelRegistry(unittest.TestCase):
+
+    def setUp(self):
+        # The made-up model names below make no room for themselves before loading
+        patcher = patch.object(tool_module, "UNKNOWN_MODEL_SIZE_MB", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_registry(self, budget_mb, sizes, delay=0):
+        self.loads = []
+
+        def loader(name):
+            self.loads.append(name)
+            time.sleep(delay)
+            return MagicMock(name=name)
+
+        return tool_module.ModelRegistry(budget_mb, loader=loader, sizer=lambda model: sizes[model._mock_name])
+
+    def test_models_are_cached_by_name(self):
+        registry = self.make_registry(1000, {"tiny": 100, "base": 200})
+
+        tiny = registry.get("tiny")
+        base = registry.get("base")
+
+        self.assertIs(registry.get("tiny"), tiny)
+        self.assertIsNot(base, tiny)
+        self.assertEqual(self.loads, ["tiny", "base"])
+        self.assertEqual(registry.loaded(), {"base": 200, "tiny": 100})
+
+    def test_least_recently_used_model_is_unloaded(self):
+        registry = self.make_registry(350, {"a": 100, "b": 200, "c": 150})
+
+        registry.get("a")
+        registry.get("b")
+        registry.get("a")
+        registry.get("c")
+
+        self.assertEqual(list(registry.loaded()), ["a", "c"])
+
+    def test_room_is_made_before_a_known_model_loads(self):
+        registry = self.make_registry(1200, {"a": 500, "small": 1000})
+        registry.get("a")
+
+        with patch.object(tool_module, "MODEL_SIZES_MB", {"small": 1000}):
+            registry.loader = lambda name: self.assertEqual(registry.loaded(), {}) or MagicMock(name=name)
+            registry.get("small")
+
+        self.assertEqual(list(registry.loaded()), ["small"])
+
+    def test_model_over_budget_is_still_loaded(self):
+        registry = self.make_registry(100, {"tiny": 80, "large": 500})
+
+        registry.get("tiny")
+        registry.get("large")
+
+        self.assertEqual(list(registry.loaded()), ["large"])
+
+    def test_concurrent_loads_are_single_flight(self):
+        registry = self.make_registry(1000, {"base": 200}, delay=0.2)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.get("base"))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.loads, ["base"])
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_failed_load_is_reported_and_retried(self):
+        registry = tool_module.ModelRegistry(1000, loader=MagicMock(side_effect=[RuntimeError("Model nope not found"), MagicMock()]), sizer=lambda model: 1)
+
+        with self.assertRaises(RuntimeError):
+            registry.get("nope")
+        registry.get("nope")
+        self.assertEqual(registry.loader.call_count, 2)
+
+    def test_status_reports_loading_ready_and_failed(self):
+        release = threading.Event()
+
+        def loader(name):
+            if name == "broken":
+                raise RuntimeError("Model broken not found")
+            release.wait(5)
+            return MagicMock(name=name)
+
+        registry = tool_module.ModelRegistry(1000, loader=loader, sizer=lambda model: 139.6)
+        thread = threading.Thread(target=registry.get, args=("base",))
+        thread.start()
+        while registry.status("base")["state"] != "loading":
+            time.sleep(0.01)
+        release.set()
+        thread.join()
+        with self.assertRaises(RuntimeError):
+            registry.get("broken")
+
+        self.assertEqual(registry.status("base"), {"state": "ready", "size_mb": 139.6})
+        self.assertEqual(registry.status("broken"), {"state": "failed", "error": "Model broken not found"})
+        self.assertEqual(registry.status("tiny"), {"state": "not loaded"})
+        self.assertEqual(registry.known(), ["base", "broken"])
+
+    @patch.dict(os.environ, {"WHISPER_MODEL": "base"})
+    def test_warmup_is_shared_with_tool_calls(self):
+        release = threading.Event()
+        loader = MagicMock(side_effect=lambda name: release.wait(5) and MagicMock(name=name))
+        registry = tool_module.ModelRegistry(1000, loader=loader, sizer=lambda model: 1)
+
+        with patch.object(tool_module, "models", registry):
+            warmup = tool_module.start_warmup()
+            while registry.status("base")["state"] != "loading":
+                time.sleep(0.01)
+            status = json.loads(get_text(asyncio.run(tool_module.whisper_model_status.run({}))))
+            self.assertEqual(status["models"], {"base": {"state": "loading"}})
+
+            waiter = threading.Thread(target=tool_module.get_model)
+            waiter.start()
+            release.set()
+            warmup.join()
+            waiter.join()
+
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual(registry.status("base")["state"], "ready")
+
+    @patch.object(tool_module, "open_url")
+    def test_unknown_model_is_rejected_before_loading(self, mock_open_url):
+        with tempfile.NamedTemporaryFile(suffix=".mp3") as f, \
+             patch.object(tool_module, "models") as mock_models:
+            local = get_text(asyncio.run(tool_module.transcribe_local_audio.run({"file_path": f.name, "model": "/tmp/model.pt"})))
+            remote = get_text(asyncio.run(tool_module.transcribe_audio.run({"url": "http://example.com/a.mp3", "model": "tiny.en2"})))
+
+        self.assertTrue(local.startswith("Error: unknown model '/tmp/model.pt'"))
+        self.assertTrue(remote.startswith("Error: unknown model 'tiny.en2'"))
+        mock_models.get.assert_not_called()
+        mock_open_url.assert_not_called()
+
+    def test_unknown_model_makes_room_for_the_largest_size(self):
+        registry = self.make_registry(6400, {"base": 300, "/models/custom.pt": 1000})
+        registry.get("base")
+
+        with patch.object(tool_module, "UNKNOWN_MODEL_SIZE_MB", 6200):
+            registry.get("/models/custom.pt")
+
+        self.assertEqual(list(registry.loaded()), ["/models/custom.pt"])
+
+    @patch.dict(os.environ, {"WHISPER_MODEL": "/models/custom.pt"})
+    def test_whisper_model_may_be_a_checkpoint_path(self):
+        with patch.object(tool_module, "models") as mock_models:
+            tool_module.get_model()
+            tool_module.get_model("/models/custom.pt")
+            self.assertEqual(mock_models.get.call_args_list, [call("/models/custom.pt")] * 2)
+            with self.assertRaises(ValueError):
+                tool_module.get_model("/models/other.pt")
+
+    @patch.dict(os.environ, {"WHISPER_MODEL": "small"})
+    def test_get_model_defaults_to_whisper_model(self):
+        with patch.object(tool_module, "models") as mock_models:
+            tool_module.get_model()
+            mock_models.get.assert_called_once_with("small")
+            tool_module.get_model("tiny")
+            mock_models.get.assert_called_with("tiny")
+
+
+class TestStartup(unittest.TestCase):
+
+    # Bound for the module's own import time, on top of fastmcp and dotenv; importing whisper and torch alone takes seconds.
+    MAX_IMPORT_SECONDS = 1.0
+
+    def test_import_does_not_load_whisper(self):
+        """Importing the server must not import whisper, torch or numba, and must stay fast."""
+        script = (
+            "import sys, time, json\n"
+            "import fastmcp, dotenv\n"
+            "started = time.perf_counter()\n"
+            "import audio_transcriber\n"
+            "elapsed = time.perf_counter() - started\n"
+            "heavy = sorted(name for name in ('whisper', 'torch', 'numba') if name in sys.modules)\n"
+            "print(json.dumps({'elapsed': elapsed, 'heavy': heavy}))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+
+        self.assertEqual(report["heavy"], [])
+        self.assertLess(report["elapsed"], self.MAX_IMPORT_SECONDS)
+        print(f"\nPASSED: Import time test ({report['elapsed']:.2f}s)")
+
 
 if __name__ == "__main__":
     unittest.main()
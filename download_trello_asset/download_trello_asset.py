@@ -1,7 +1,19 @@
 #!/usr/bin/env python3
+import io
 import os
+import json
+import random
+import time
+import shutil
+import hashlib
+import email.utils
+import threading
+import http.client
+import urllib.parse
 import urllib.request
 import urllib.error
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from fastmcp import FastMCP
 from dotenv import load_dotenv
 
@@ -11,41 +23,906 @@ load_dotenv()
 # Initialize FastMCP server
 mcp = FastMCP("Trello Asset Downloader")
 
-@mcp.tool()
-def download_trello_asset(url: str, output_path: str) -> str:
+# Bytes read from the response and written to disk at a time.
+BUFFER_SIZE = int(os.environ.get("TRELLO_DOWNLOAD_BUFFER_SIZE", str(1024 * 1024)))
+# Downloads running at the same time in download_trello_assets, in total and against one host.
+MAX_CONCURRENCY = int(os.environ.get("TRELLO_DOWNLOAD_CONCURRENCY", "8"))
+PER_HOST_CONCURRENCY = int(os.environ.get("TRELLO_DOWNLOAD_PER_HOST", "4"))
+# Idle keep-alive connections kept per host, and seconds before an idle connection is closed.
+POOL_SIZE = int(os.environ.get("TRELLO_POOL_SIZE", "8"))
+POOL_IDLE_TIMEOUT = float(os.environ.get("TRELLO_POOL_IDLE_TIMEOUT", "60"))
+# Redirects followed per request (attachment URLs redirect to a storage host).
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+# Trello allows 100 requests per 10 seconds per token and 300 per 10 seconds per API key.
+RATE_LIMIT_INTERVAL = 10.0
+TOKEN_RATE_LIMIT = int(os.environ.get("TRELLO_TOKEN_RATE_LIMIT", "100"))
+KEY_RATE_LIMIT = int(os.environ.get("TRELLO_KEY_RATE_LIMIT", "300"))
+# Retries of requests answered with 429 or a 5xx status, with exponential backoff between BACKOFF_BASE and BACKOFF_MAX seconds.
+MAX_RETRIES = int(os.environ.get("TRELLO_MAX_RETRIES", "5"))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+# Trello REST API, used to list card and board attachments.
+API_URL = "https://api.trello.com/1"
+ATTACHMENT_FIELDS = "id,name,bytes,mimeType,date,url,isUpload"
+# Downloaded assets are kept here and revalidated with conditional requests instead of downloaded again.
+CACHE_DIR = os.environ.get("TRELLO_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "mcptools", "trello-assets"
+)
+# Maximum total size of the cache in bytes (0 disables it).
+CACHE_MAX_BYTES = int(os.environ.get("TRELLO_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+
+class ConnectionPool:
+    """Keeps idle HTTP/1.1 connections per (scheme, host, port) so later requests skip the TCP and TLS handshakes."""
+
+    def __init__(self, size: int, idle_timeout: float):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        # (scheme, host, port) -> [(connection, time it became idle)], most recent last
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: tuple) -> tuple[http.client.HTTPConnection, bool]:
+        """Returns a connection for key and whether it was reused from the pool."""
+        now = time.monotonic()
+        stale = []
+        connection = None
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                candidate, since = idle.pop()
+                if now - since < self.idle_timeout:
+                    connection = candidate
+                    break
+                stale.append(candidate)
+        for candidate in stale:
+            candidate.close()
+        if connection:
+            return connection, True
+        return self.connect(key), False
+
+    def connect(self, key: tuple) -> http.client.HTTPConnection:
+        """Returns a new connection for key."""
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(host, port)
+
+    def release(self, key: tuple, connection: http.client.HTTPConnection):
+        """Returns a connection whose response was fully read to the pool, or closes it if the pool is full."""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.size:
+                idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def clear(self):
+        """Closes all idle connections."""
+        with self._lock:
+            idle = [connection for connections in self._idle.values() for connection, _ in connections]
+            self._idle.clear()
+        for connection in idle:
+            connection.close()
+
+
+pool = ConnectionPool(POOL_SIZE, POOL_IDLE_TIMEOUT)
+
+
+class PooledResponse:
+    """A response whose connection goes back to the pool once the body has been read."""
+
+    def __init__(self, response: http.client.HTTPResponse, connection: http.client.HTTPConnection, key: tuple, url: str):
+        self._response = response
+        self._connection = connection
+        self._key = key
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+
+    def read(self, amt: int = None) -> bytes:
+        return self._response.read(amt)
+
+    def close(self):
+        if self._connection is None:
+            return
+        connection, self._connection = self._connection, None
+        # http.client marks the response closed once the whole body has been read.
+        if self._response.isclosed() and not self._response.will_close:
+            pool.release(self._key, connection)
+        else:
+            self._response.close()
+            connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def uses_proxy(url: str) -> bool:
+    """Checks whether a proxy from the environment applies to url."""
+    parts = urllib.parse.urlsplit(url)
+    return parts.scheme in urllib.request.getproxies() and not urllib.request.proxy_bypass(parts.hostname or "")
+
+
+def open_url(url: str, headers: dict):
     """
-    Downloads an authenticated asset from Trello to a local path.
-    Requires TRELLO_API_KEY and TRELLO_TOKEN environment variables to be set in the MCP server configuration.
+    GETs url over a pooled keep-alive connection, following redirects. The Authorization header is
+    only sent to the original host. Raises urllib.error.HTTPError for error statuses, like urlopen.
+    Falls back to urlopen when a proxy is configured for the URL.
+    """
+    if uses_proxy(url):
+        return urllib.request.urlopen(urllib.request.Request(url, headers=headers))
+
+    origin = urllib.parse.urlsplit(url).netloc.lower()
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise urllib.error.URLError(f"unsupported URL scheme: {parts.scheme}")
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = urllib.parse.urlunsplit(("", "", parts.path or "/", parts.query, ""))
+        request_headers = headers if parts.netloc.lower() == origin else {
+            name: value for name, value in headers.items() if name.lower() != "authorization"
+        }
+
+        def send(connection):
+            connection.request("GET", path, headers=request_headers)
+            return connection.getresponse()
+
+        connection, reused = pool.acquire(key)
+        try:
+            response = send(connection)
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            connection.close()
+            if not reused:
+                raise
+            # The server closed the idle connection; retry once on a new one.
+            connection = pool.connect(key)
+            try:
+                response = send(connection)
+            except BaseException:
+                connection.close()
+                raise
+        except BaseException:
+            connection.close()
+            raise
+
+        pooled = PooledResponse(response, connection, key, url)
+        if response.status in REDIRECT_STATUSES and response.headers.get("Location"):
+            # Drain the body so the connection can be reused.
+            with pooled:
+                response.read()
+            url = urllib.parse.urljoin(url, response.headers["Location"])
+            continue
+        if response.status >= 400:
+            with pooled:
+                body = response.read()
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+        return pooled
+    raise urllib.error.URLError(f"too many redirects (more than {MAX_REDIRECTS})")
+
+
+def partial_paths(output_path: str) -> tuple[str, str]:
+    """Returns the paths of the partial download and of its sidecar for output_path."""
+    part_path = f"{output_path}.part"
+    return part_path, f"{part_path}.json"
+
+
+def discard_partial(output_path: str):
+    """Removes the partial download of output_path and its sidecar, if any."""
+    for path in partial_paths(output_path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def load_partial(output_path: str, url: str) -> dict:
+    """
+    Returns the state of an interrupted download of url to output_path, with "offset" set to the
+    size of the partial file, or None if there is nothing to resume (any stale partial file is removed).
+    """
+    part_path, sidecar_path = partial_paths(output_path)
+    try:
+        with open(sidecar_path) as f:
+            state = json.load(f)
+        state["offset"] = os.path.getsize(part_path)
+    except (OSError, ValueError):
+        discard_partial(output_path)
+        return None
+    if state.get("url") != url or not if_range_validator(state) or not state["offset"]:
+        discard_partial(output_path)
+        return None
+    return state
+
+
+def save_partial(output_path: str, state: dict):
+    with open(partial_paths(output_path)[1], "w") as f:
+        json.dump(state, f)
+
+
+def if_range_validator(state: dict) -> str:
+    """Returns the value for If-Range: the ETag unless it is weak, else Last-Modified."""
+    etag = state.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return state.get("last_modified")
+
+
+def response_state(response, url: str) -> dict:
+    """Returns the sidecar state for a response, or None if the server gave no validator to resume with."""
+    headers = response.headers
+    state = {"url": url, "etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+    return state if if_range_validator(state) else None
+
+
+def stream_to_file(response, output_path: str, buffer_size: int = None, checksum: bool = False,
+                   offset: int = 0, state: dict = None) -> tuple[int, str]:
+    """
+    Copies the response body to output_path in buffer_size chunks, so memory use does not grow with
+    the file size. The data goes to output_path + ".part", which replaces output_path only once the
+    download is complete. With offset, the body is appended to the first offset bytes of the partial file.
+    If the download fails and state is given, the partial file is kept with a sidecar to resume from,
+    otherwise it is removed.
+    Returns the number of bytes received and the SHA-256 hex digest of the file (or None without checksum).
     """
+    buffer_size = buffer_size or BUFFER_SIZE
+    part_path, sidecar_path = partial_paths(output_path)
+    digest = hashlib.sha256() if checksum else None
+    size = 0
+    if state:
+        save_partial(output_path, dict(state, offset=offset))
+    try:
+        with open(part_path, "r+b" if offset else "wb") as out_file:
+            if offset:
+                out_file.truncate(offset)
+                while digest and (chunk := out_file.read(buffer_size)):
+                    digest.update(chunk)
+                out_file.seek(offset)
+            while chunk := response.read(buffer_size):
+                out_file.write(chunk)
+                size += len(chunk)
+                if digest:
+                    digest.update(chunk)
+        os.replace(part_path, output_path)
+        if state:
+            os.remove(sidecar_path)
+    except BaseException:
+        if state and os.path.exists(part_path):
+            save_partial(output_path, dict(state, offset=offset + size))
+        else:
+            discard_partial(output_path)
+        raise
+    return size, digest.hexdigest() if digest else None
+
+
+class TokenBucket:
+    """
+    Spaces out requests so that no more than limit of them start in any window of interval seconds.
+    A tenth of the limit may start at once; the rest is spread evenly. Callers reserve a slot and
+    wait their turn, so requests queue up in order instead of failing.
+    """
+
+    def __init__(self, limit: int, interval: float):
+        self._lock = threading.Lock()
+        self.capacity, self.rate = self.shape(limit, interval)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @staticmethod
+    def shape(limit: int, interval: float) -> tuple[float, float]:
+        """Returns (burst capacity, tokens per second) for a limit; capacity + rate * interval never exceeds it."""
+        capacity = max(1.0, limit / 10)
+        return capacity, max(limit - capacity, 1.0) / interval
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Takes a slot and returns the number of seconds to wait before using it."""
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            return max(0.0, -self.tokens / self.rate)
+
+    def pause(self, seconds: float):
+        """Makes sure no slot is handed out for the next seconds (after a 429 or an exhausted quota)."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, -seconds * self.rate)
+
+    def update(self, limit: int, interval: float):
+        """Adopts the limit the server reported."""
+        with self._lock:
+            self._refill()
+            self.capacity, self.rate = self.shape(limit, interval)
+            self.tokens = min(self.tokens, self.capacity)
+
+
+class RateLimiter:
+    """Token buckets per Trello API token and per API key, shared by all requests of the process."""
+
+    # Response header prefixes for the token and key limits: -max, -interval-ms, -remaining.
+    HEADERS = {"token": "x-rate-limit-api-token", "key": "x-rate-limit-api-key"}
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def buckets(self, key: str, token: str) -> dict:
+        with self._lock:
+            if ("token", token) not in self._buckets:
+                self._buckets[("token", token)] = TokenBucket(TOKEN_RATE_LIMIT, RATE_LIMIT_INTERVAL)
+            if ("key", key) not in self._buckets:
+                self._buckets[("key", key)] = TokenBucket(KEY_RATE_LIMIT, RATE_LIMIT_INTERVAL)
+            return {"token": self._buckets[("token", token)], "key": self._buckets[("key", key)]}
+
+    def wait(self, key: str, token: str):
+        """Blocks until a request may be sent for both the token and the key."""
+        delay = max(bucket.reserve() for bucket in self.buckets(key, token).values())
+        if delay:
+            time.sleep(delay)
+
+    def observe(self, key: str, token: str, headers):
+        """Applies the rate limit headers of a response."""
+        for kind, bucket in self.buckets(key, token).items():
+            prefix = self.HEADERS[kind]
+            try:
+                limit = int(headers.get(f"{prefix}-max"))
+                interval = int(headers.get(f"{prefix}-interval-ms")) / 1000
+            except (TypeError, ValueError):
+                continue
+            bucket.update(limit, interval)
+            if headers.get(f"{prefix}-remaining") == "0":
+                bucket.pause(interval / max(limit, 1))
+
+    def pause(self, key: str, token: str, seconds: float):
+        for bucket in self.buckets(key, token).values():
+            bucket.pause(seconds)
+
+
+rate_limiter = RateLimiter()
+
+
+def retry_after(headers) -> float:
+    """Returns the Retry-After header in seconds (it may also be an HTTP date), or None."""
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, headers=None) -> float:
+    """Seconds to wait before retry number attempt (from 0): full jitter, but at least Retry-After."""
+    delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+    server_delay = retry_after(headers)
+    return delay if server_delay is None else server_delay + random.uniform(0, BACKOFF_BASE)
+
+
+def trello_get(url: str, headers: dict):
+    """
+    Opens url like open_url, waiting for the Trello rate limits first. 429 and 5xx responses are
+    retried up to MAX_RETRIES times with backoff, and pause the other requests too on a 429.
+    """
+    key = os.environ.get("TRELLO_API_KEY", "")
+    token = os.environ.get("TRELLO_TOKEN", "")
+    attempt = 0
+    while True:
+        rate_limiter.wait(key, token)
+        try:
+            response = open_url(url, headers)
+        except urllib.error.HTTPError as e:
+            retryable = e.code == 429 or 500 <= e.code < 600
+            if not retryable or attempt >= MAX_RETRIES:
+                raise
+            rate_limiter.observe(key, token, e.headers)
+            delay = backoff_delay(attempt, e.headers)
+            if e.code == 429:
+                rate_limiter.pause(key, token, delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        rate_limiter.observe(key, token, response.headers)
+        return response
+
+
+def copy_atomically(source: str, destination: str):
+    """
+    Atomically puts a copy of source at destination. Cache entries and downloaded files never share
+    an inode, so editing a downloaded file in place cannot change what the cache serves later.
+    """
+    temp_path = f"{destination}.{threading.get_ident()}.tmp"
+    try:
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def file_sha256(path: str) -> str:
+    """Returns the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(BUFFER_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AssetCache:
+    """
+    Downloaded assets keyed by URL, with the ETag/Last-Modified they were served with.
+    Each entry is <sha256 of url>.data with a .json holding its metadata; the least recently used
+    entries are evicted once the total size exceeds max_bytes. Hit/miss counts are kept in stats.json.
+    """
+
+    STATS = {"hits": 0, "misses": 0, "bytes_saved": 0}
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        base = os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest())
+        return f"{base}.data", f"{base}.json"
+
+    def _write_json(self, path: str, data: dict):
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+    def lookup(self, url: str) -> dict:
+        """Returns the cache entry for url, or None."""
+        if not self.enabled():
+            return None
+        data_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                entry = json.load(f)
+            if entry.get("url") != url or os.path.getsize(data_path) != entry.get("size"):
+                return None
+        except (OSError, ValueError):
+            return None
+        return dict(entry, path=data_path)
+
+    def conditional_headers(self, entry: dict) -> dict:
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def restore(self, entry: dict, output_path: str) -> bool:
+        """
+        Puts the cached file for a "304 Not Modified" response at output_path. Returns False, and
+        drops the entry, if another download evicted the file after it was looked up.
+        """
+        data_path, meta_path = self._paths(entry["url"])
+        try:
+            copy_atomically(entry["path"], output_path)
+        except FileNotFoundError:
+            with self._lock:
+                for path in (data_path, meta_path):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            return False
+        with self._lock:
+            if os.path.exists(data_path):
+                self._write_json(meta_path, dict(
+                    {key: value for key, value in entry.items() if key != "path"}, last_used=time.time()
+                ))
+        self.record(hit=True, size=entry["size"])
+        return True
+
+    def store(self, url: str, output_path: str, state: dict):
+        """Adds a freshly downloaded file to the cache, if the server gave validators for it."""
+        self.record(hit=False)
+        if not self.enabled() or not state:
+            return
+        size = os.path.getsize(output_path)
+        if size > self.max_bytes:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        data_path, meta_path = self._paths(url)
+        # The copy is made outside the lock, so parallel downloads do not wait for each other's copies.
+        temp_path = f"{data_path}.{threading.get_ident()}.tmp"
+        try:
+            shutil.copyfile(output_path, temp_path)
+            with self._lock:
+                os.replace(temp_path, data_path)
+                self._write_json(meta_path, {
+                    "url": url, "etag": state.get("etag"), "last_modified": state.get("last_modified"),
+                    "size": size, "last_used": time.time(),
+                })
+                self._evict()
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json") or name == "stats.json":
+                continue
+            meta_path = os.path.join(self.directory, name)
+            try:
+                with open(meta_path) as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            entries.append((entry.get("last_used", 0), entry.get("size", 0), meta_path))
+            total += entry.get("size", 0)
+        for _, size, meta_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in (meta_path[:-len(".json")] + ".data", meta_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def _stats_path(self) -> str:
+        return os.path.join(self.directory, "stats.json")
+
+    def _read_stats(self) -> dict:
+        try:
+            with open(self._stats_path()) as f:
+                return dict(self.STATS, **json.load(f))
+        except (OSError, ValueError):
+            return dict(self.STATS)
+
+    def record(self, hit: bool, size: int = 0):
+        if not self.enabled():
+            return
+        with self._lock:
+            stats = self._read_stats()
+            if hit:
+                stats["hits"] += 1
+                stats["bytes_saved"] += size
+            else:
+                stats["misses"] += 1
+            os.makedirs(self.directory, exist_ok=True)
+            self._write_json(self._stats_path(), stats)
+
+    def stats(self) -> dict:
+        """Returns the hit/miss counts with the number and total size of the cached files."""
+        with self._lock:
+            stats = self._read_stats()
+            sizes = []
+            if os.path.isdir(self.directory):
+                sizes = [
+                    os.path.getsize(os.path.join(self.directory, name))
+                    for name in os.listdir(self.directory) if name.endswith(".data")
+                ]
+        return dict(stats, entries=len(sizes), bytes=sum(sizes), max_bytes=self.max_bytes, directory=self.directory)
+
+
+cache = AssetCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+
+def format_transfer(size: int, elapsed: float) -> str:
+    """Describes a transfer as bytes, seconds and throughput."""
+    rate = size / elapsed / (1024 * 1024) if elapsed > 0 else 0.0
+    return f"{size} bytes in {elapsed:.2f}s, {rate:.2f} MiB/s"
+
+
+def open_download(url: str, headers: dict, partial: dict = None):
+    """Opens url, asking only for the bytes after a partial download if there is one."""
+    if partial:
+        headers = dict(headers, Range=f"bytes={partial['offset']}-")
+        headers["If-Range"] = if_range_validator(partial)
+    return trello_get(url, headers)
+
+
+def continues_partial(response, partial: dict) -> bool:
+    """Checks whether a 206 response starts exactly where the partial download ended."""
+    return bool(partial) and response.headers.get("Content-Range", "").startswith(f"bytes {partial['offset']}-")
+
+
+def auth_headers() -> dict:
+    """Returns the Trello OAuth request headers, or None if the credentials are not configured."""
     key = os.environ.get("TRELLO_API_KEY")
     token = os.environ.get("TRELLO_TOKEN")
 
     if not key or not token:
-        return "Error: TRELLO_API_KEY and TRELLO_TOKEN environment variables must be set."
+        return None
+    return {
+        "Authorization": f'OAuth oauth_consumer_key="{key}", oauth_token="{token}"',
+        "User-Agent": "Gemini-CLI-Tool"
+    }
 
-    try:
-        # Ensure directory exists
-        directory = os.path.dirname(output_path)
-        if directory and not os.path.exists(directory):
-            os.makedirs(directory)
 
-        headers = {
-            "Authorization": f'OAuth oauth_consumer_key="{key}", oauth_token="{token}"',
-            "User-Agent": "Gemini-CLI-Tool"
-        }
-        
-        req = urllib.request.Request(url, headers=headers)
-        
-        with urllib.request.urlopen(req) as response:
-            with open(output_path, 'wb') as out_file:
-                out_file.write(response.read())
-        
-        return f"Successfully saved to {output_path}"
+def download(url: str, output_path: str, headers: dict, checksum: bool = False) -> str:
+    """Downloads url to output_path, resuming a partial download, and returns the success message."""
+    # Ensure directory exists
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
 
+    started = time.monotonic()
+    partial = load_partial(output_path, url)
+    cached = None if partial else cache.lookup(url)
+    request_headers = dict(headers, **cache.conditional_headers(cached)) if cached else headers
+    try:
+        response = open_download(url, request_headers, partial)
     except urllib.error.HTTPError as e:
+        if e.code == 304 and cached:
+            # urlopen reports "304 Not Modified" as an error.
+            response = e
+        elif e.code == 416 and partial:
+            # The partial file does not fit the remote file any more; start over.
+            discard_partial(output_path)
+            partial = None
+            response = open_download(url, headers, partial)
+        else:
+            raise
+
+    if cached and response.status == 304:
+        with response:
+            response.read()
+        if cache.restore(cached, output_path):
+            message = f"Successfully saved to {output_path} (not modified, {cached['size']} bytes from the cache)"
+            if checksum:
+                message += f"\nSHA-256: {file_sha256(output_path)}"
+            return message
+        # The cached file was evicted by another download after the lookup; fetch it again.
+        response = open_download(url, headers, partial)
+
+    if response.status == 206 and not continues_partial(response, partial):
+        # The range does not continue the partial file (or none was asked for); start over.
+        response.close()
+        discard_partial(output_path)
+        partial = None
+        response = open_download(url, headers, partial)
+        if response.status != 200:
+            response.close()
+            raise RuntimeError(f"Expected the whole file, got HTTP {response.status}")
+
+    with response:
+        offset = 0
+        if response.status == 206:
+            offset = partial["offset"]
+            state = partial
+        else:
+            # The server ignored the range, or the file changed: fetch it all again.
+            state = response_state(response, url)
+        size, sha256 = stream_to_file(response, output_path, checksum=checksum, offset=offset, state=state)
+    elapsed = time.monotonic() - started
+    cache.store(url, output_path, state)
+
+    message = f"Successfully saved to {output_path} ({format_transfer(size, elapsed)})"
+    if offset:
+        message += f"\nResumed a partial download at byte {offset}"
+    if sha256:
+        message += f"\nSHA-256: {sha256}"
+    return message
+
+
+def describe_error(e: Exception) -> str:
+    """Formats a download failure the way the tools report it."""
+    if isinstance(e, urllib.error.HTTPError):
         return f"HTTP Error {e.code}: {e.reason}"
-    except urllib.error.URLError as e:
+    if isinstance(e, urllib.error.URLError):
         return f"URL Error: {e.reason}"
+    return f"Error: {e}"
+
+
+class HostLimiter:
+    """Limits the number of downloads running at the same time against each host."""
+
+    def __init__(self, per_host: int):
+        self.per_host = per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url: str) -> threading.Semaphore:
+        host = urllib.parse.urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
+
+
+def download_many(items: list[dict], headers: dict, checksum: bool = False) -> list[dict]:
+    """
+    Downloads {"url", "output_path"} items concurrently, limited per host, and returns one result per item.
+    Items with an "mtime" get that modification time once downloaded.
+    """
+    limit_host = HostLimiter(PER_HOST_CONCURRENCY)
+    targets = [os.path.abspath(item.get("output_path") or "") for item in items]
+
+    def run(index: int, item: dict) -> dict:
+        url, output_path = item.get("url"), item.get("output_path")
+        result = {"url": url, "output_path": output_path}
+        if not url or not output_path:
+            return dict(result, status="error", error="Error: each item needs a url and an output_path")
+        if targets.count(targets[index]) > 1:
+            return dict(result, status="error", error=f"Error: more than one item writes to {output_path}")
+        try:
+            with limit_host(url):
+                message = download(url, output_path, headers, checksum)
+            if item.get("mtime") is not None:
+                os.utime(output_path, (item["mtime"], item["mtime"]))
+        except Exception as e:
+            return dict(result, status="error", error=describe_error(e))
+        return dict(result, status="ok", message=message)
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as executor:
+        return list(executor.map(run, range(len(items)), items))
+
+
+def api_get(path: str, headers: dict, params: dict = None):
+    """GETs a Trello REST API resource and returns the decoded JSON."""
+    url = f"{API_URL}/{path}"
+    if params:
+        url += "?" + urllib.parse.urlencode(params)
+    with trello_get(url, dict(headers, Accept="application/json")) as response:
+        return json.loads(response.read())
+
+
+def safe_filename(name: str, fallback: str) -> str:
+    """Turns a Trello attachment or card name into a single path component."""
+    name = "".join("_" if char in "/\\\0" else char for char in (name or "")).strip()
+    return fallback if name in ("", ".", "..") else name
+
+
+def attachment_mtime(attachment: dict) -> float:
+    """Returns the attachment date as a timestamp, or None."""
+    try:
+        return datetime.fromisoformat(attachment["date"].replace("Z", "+00:00")).timestamp()
+    except (KeyError, AttributeError, ValueError):
+        return None
+
+
+def plan_attachments(attachments: list[dict], dest_dir: str) -> tuple[list[dict], list[dict]]:
+    """
+    Maps uploaded attachments to files in dest_dir. Returns the download items and the results for
+    files that are already there with the same size and date. Links (attachments that are not uploads) are ignored.
+    """
+    items, skipped = [], []
+    used = set()
+    for attachment in attachments:
+        if attachment.get("isUpload") is False or not attachment.get("url"):
+            continue
+        name = safe_filename(attachment.get("name"), attachment.get("id", "attachment"))
+        if name in used:
+            name = f"{attachment.get('id')}-{name}"
+        used.add(name)
+        output_path = os.path.join(dest_dir, name)
+        mtime = attachment_mtime(attachment)
+        try:
+            current = os.stat(output_path)
+            up_to_date = (attachment.get("bytes") == current.st_size and mtime is not None
+                          and int(current.st_mtime) == int(mtime))
+        except OSError:
+            up_to_date = False
+        if up_to_date:
+            skipped.append({"url": attachment["url"], "output_path": output_path, "status": "skipped"})
+        else:
+            items.append({"url": attachment["url"], "output_path": output_path, "mtime": mtime})
+    return items, skipped
+
+
+def summarize_sync(results: list[dict]) -> str:
+    """Formats the results of a card or board sync as JSON with per-status counts."""
+    counts = {status: sum(result["status"] == status for result in results) for status in ("ok", "skipped", "error")}
+    return json.dumps({
+        "downloaded": counts["ok"], "skipped": counts["skipped"], "failed": counts["error"], "results": results,
+    }, indent=2)
+
+
+@mcp.tool()
+def download_trello_asset(url: str, output_path: str, checksum: bool = False) -> str:
+    """
+    Downloads an authenticated asset from Trello to a local path.
+    Requires TRELLO_API_KEY and TRELLO_TOKEN environment variables to be set in the MCP server configuration.
+    With checksum, also reports the SHA-256 of the downloaded file.
+    An interrupted download is kept as output_path + ".part" and resumed by the next call for the same URL.
+    """
+    headers = auth_headers()
+    if not headers:
+        return "Error: TRELLO_API_KEY and TRELLO_TOKEN environment variables must be set."
+
+    try:
+        return download(url, output_path, headers, checksum)
+    except Exception as e:
+        return describe_error(e)
+
+
+@mcp.tool()
+def download_trello_assets(items: list[dict], checksum: bool = False) -> str:
+    """
+    Downloads many authenticated Trello assets concurrently.
+    items is a list of {"url": ..., "output_path": ...}. Returns a JSON list with one result per item,
+    in order: {"url", "output_path", "status": "ok", "message"} or {"url", "output_path", "status": "error", "error"}.
+    A failed item does not stop the others.
+    """
+    headers = auth_headers()
+    if not headers:
+        return "Error: TRELLO_API_KEY and TRELLO_TOKEN environment variables must be set."
+
+    return json.dumps(download_many(items, headers, checksum), indent=2)
+
+
+@mcp.tool()
+def download_card_attachments(card_id: str, dest_dir: str, checksum: bool = False) -> str:
+    """
+    Downloads all uploaded attachments of a Trello card into dest_dir, concurrently.
+    Files that already exist with the attachment's size and date are skipped; downloaded files get
+    the attachment date as modification time. Returns JSON with downloaded/skipped/failed counts and
+    a result per attachment.
+    """
+    headers = auth_headers()
+    if not headers:
+        return "Error: TRELLO_API_KEY and TRELLO_TOKEN environment variables must be set."
+
+    try:
+        attachments = api_get(f"cards/{urllib.parse.quote(card_id)}/attachments", headers, {"fields": ATTACHMENT_FIELDS})
+        items, skipped = plan_attachments(attachments, dest_dir)
+        return summarize_sync(skipped + download_many(items, headers, checksum))
+    except Exception as e:
+        return describe_error(e)
+
+
+@mcp.tool()
+def download_board_attachments(board_id: str, dest_dir: str, checksum: bool = False) -> str:
+    """
+    Downloads the uploaded attachments of all open cards on a Trello board, one subdirectory of
+    dest_dir per card ("<card name>-<card id>"). Works like download_card_attachments, with a
+    single API call for the whole board.
+    """
+    headers = auth_headers()
+    if not headers:
+        return "Error: TRELLO_API_KEY and TRELLO_TOKEN environment variables must be set."
+
+    try:
+        cards = api_get(f"boards/{urllib.parse.quote(board_id)}/cards", headers, {
+            "fields": "id,name", "attachments": "true", "attachment_fields": ATTACHMENT_FIELDS,
+        })
+        items, skipped = [], []
+        for card in cards:
+            if not card.get("attachments"):
+                continue
+            card_dir = os.path.join(dest_dir, f"{safe_filename(card.get('name'), 'card')}-{card['id']}")
+            card_items, card_skipped = plan_attachments(card["attachments"], card_dir)
+            items += card_items
+            skipped += card_skipped
+        return summarize_sync(skipped + download_many(items, headers, checksum))
+    except Exception as e:
+        return describe_error(e)
+
+
+@mcp.tool()
+def trello_cache_stats() -> str:
+    """
+    Reports the download cache as JSON: hits (files revalidated and reused), misses (full downloads),
+    bytes_saved, the number and total size of cached files, the size limit and the cache directory.
+    """
+    try:
+        return json.dumps(cache.stats(), indent=2)
     except Exception as e:
         return f"Error: {e}"
 
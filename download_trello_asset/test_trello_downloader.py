@@ -1,6 +1,16 @@
 import sys
 import os
+import json
+import shutil
+import time
+import hashlib
+import email.utils
+from datetime import datetime
+import tempfile
+import threading
 import unittest
+import http.server
+import urllib.error
 from unittest.mock import patch, MagicMock
 import asyncio
 
@@ -9,6 +19,11 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import download_trello_asset as tool_module
 
+# The package re-exports the module, so patch the module the functions actually live in
+impl_module = sys.modules[tool_module.download.__module__]
+# Keep the download cache out of the user's home directory
+impl_module.cache.directory = tempfile.mkdtemp(prefix="trello-cache-test-")
+
 def get_text(result):
     text = ""
     if hasattr(result, 'content'):
@@ -20,13 +35,14 @@ def get_text(result):
 class TestTrelloDownloader(unittest.TestCase):
     
     @patch.dict(os.environ, {"TRELLO_API_KEY": "fake_key", "TRELLO_TOKEN": "fake_token"})
-    @patch("urllib.request.urlopen")
-    def test_download_success(self, mock_urlopen):
+    @patch.object(impl_module, "open_url")
+    def test_download_success(self, mock_open_url):
         # Mock response
         mock_response = MagicMock()
         mock_response.__enter__.return_value = mock_response
-        mock_response.read.return_value = b"fake_image_data"
-        mock_urlopen.return_value = mock_response
+        mock_response.headers = {}
+        mock_response.read.side_effect = [b"fake_image_data", b""]
+        mock_open_url.return_value = mock_response
 
         # Run tool
         output_path = "/tmp/test_image.png"
@@ -50,6 +66,79 @@ class TestTrelloDownloader(unittest.TestCase):
             
         print("\nPASSED: Download success test")
 
+    @patch.dict(os.environ, {"TRELLO_API_KEY": "fake_key", "TRELLO_TOKEN": "fake_token"})
+    @patch.object(impl_module, "open_url")
+    def test_download_streams_in_chunks_with_checksum(self, mock_open_url):
+        mock_response = MagicMock()
+        mock_response.__enter__.return_value = mock_response
+        mock_response.headers = {}
+        mock_response.read.side_effect = [b"abc", b"def", b""]
+        mock_open_url.return_value = mock_response
+
+        with tempfile.TemporaryDirectory() as directory:
+            output_path = os.path.join(directory, "video.mp4")
+            with patch.object(impl_module, "BUFFER_SIZE", 3):
+                res = asyncio.run(tool_module.download_trello_asset.run({
+                    "url": "https://trello.com/fake/url",
+                    "output_path": output_path,
+                    "checksum": True
+                }))
+            text = get_text(res)
+
+            self.assertIn("(6 bytes in ", text)
+            self.assertIn(f"SHA-256: {hashlib.sha256(b'abcdef').hexdigest()}", text)
+            with open(output_path, "rb") as f:
+                self.assertEqual(f.read(), b"abcdef")
+            self.assertEqual(os.listdir(directory), ["video.mp4"])
+        mock_response.read.assert_called_with(3)
+        print("\nPASSED: Chunked download test")
+
+    @patch.dict(os.environ, {"TRELLO_API_KEY": "fake_key", "TRELLO_TOKEN": "fake_token"})
+    @patch.object(impl_module, "open_url")
+    def test_failed_download_keeps_existing_file(self, mock_open_url):
+        mock_response = MagicMock()
+        mock_response.__enter__.return_value = mock_response
+        mock_response.headers = {}
+        mock_response.read.side_effect = [b"partial", ConnectionResetError("connection reset")]
+        mock_open_url.return_value = mock_response
+
+        with tempfile.TemporaryDirectory() as directory:
+            output_path = os.path.join(directory, "image.png")
+            with open(output_path, "wb") as f:
+                f.write(b"previous")
+            res = asyncio.run(tool_module.download_trello_asset.run({
+                "url": "https://trello.com/fake/url",
+                "output_path": output_path
+            }))
+
+            self.assertIn("Error: connection reset", get_text(res))
+            with open(output_path, "rb") as f:
+                self.assertEqual(f.read(), b"previous")
+            self.assertEqual(os.listdir(directory), ["image.png"])
+        print("\nPASSED: Failed download test")
+
+    @patch.dict(os.environ, {"TRELLO_API_KEY": "fake_key", "TRELLO_TOKEN": "fake_token"})
+    @patch.object(impl_module, "open_url")
+    def test_interrupted_download_keeps_partial_file(self, mock_open_url):
+        mock_response = MagicMock()
+        mock_response.__enter__.return_value = mock_response
+        mock_response.headers = {"ETag": '"v1"'}
+        mock_response.read.side_effect = [b"partial", ConnectionResetError("connection reset")]
+        mock_open_url.return_value = mock_response
+
+        with tempfile.TemporaryDirectory() as directory:
+            output_path = os.path.join(directory, "video.mp4")
+            res = asyncio.run(tool_module.download_trello_asset.run({
+                "url": "https://trello.com/fake/url",
+                "output_path": output_path
+            }))
+
+            self.assertIn("Error: connection reset", get_text(res))
+            self.assertEqual(sorted(os.listdir(directory)), ["video.mp4.part", "video.mp4.part.json"])
+            with open(output_path + ".part.json") as f:
+                self.assertEqual(json.load(f), {"url": "https://trello.com/fake/url", "etag": '"v1"', "last_modified": None, "offset": 7})
+        print("\nPASSED: Interrupted download test")
+
     @patch.dict(os.environ, {}, clear=True)
     def test_missing_env_vars(self):
         res = asyncio.run(tool_module.download_trello_asset.run({
@@ -60,5 +149,563 @@ class TestTrelloDownloader(unittest.TestCase):
         self.assertIn("Error: TRELLO_API_KEY", text)
         print("\nPASSED: Missing env vars test")
 
+class AssetHandler(http.server.BaseHTTPRequestHandler):
+    """Serves DATA with an ETag, honouring Range/If-Range when the server supports ranges."""
+
+    DATA = bytes(range(256)) * 40
+    ETAG = '"v2"'
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        self.server.clients.add(self.client_address)
+        if self.path.endswith("/missing"):
+            self.send_response(404)
+            self.send_header("Content-Length", "9")
+            self.end_headers()
+            self.wfile.write(b"not found")
+            return
+        if self.path.startswith("/redirect"):
+            self.send_response(302)
+            self.send_header("Location", f"http://localhost:{self.server.server_port}/cdn/file")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.endswith("/close"):
+            self.close_connection = True
+        if self.headers.get("If-None-Match") == self.ETAG:
+            self.send_response(304)
+            self.send_header("ETag", self.ETAG)
+            self.end_headers()
+            return
+        data = self.DATA
+        requested = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if self.server.ranges and requested and if_range in (None, self.ETAG):
+            start = int(requested[len("bytes="):].rstrip("-"))
+            if self.server.ranges == "from-start":
+                # A broken server answering every range with the start of the file
+                start = 0
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+            data = data[start:]
+        else:
+            self.send_response(200)
+        self.send_header("ETag", self.ETAG)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class LocalServerTestCase(unittest.TestCase):
+    """Runs `handler` on a local HTTP server for each test; self.base is its URL."""
+
+    handler = AssetHandler
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self.handler)
+        self.server.ranges = True
+        self.server.requests = []
+        self.server.clients = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.base = f"http://127.0.0.1:{self.server.server_port}"
+
+
+@patch.dict(os.environ, {"TRELLO_API_KEY": "fake_key", "TRELLO_TOKEN": "fake_token"})
+class TestResumableDownload(LocalServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = f"{self.base}/attachment.bin"
+        self.directory = tempfile.TemporaryDirectory()
+        self.output_path = os.path.join(self.directory.name, "attachment.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_partial(self, data, etag=AssetHandler.ETAG):
+        with open(self.output_path + ".part", "wb") as f:
+            f.write(data)
+        with open(self.output_path + ".part.json", "w") as f:
+            json.dump({"url": self.url, "etag": etag, "last_modified": None, "offset": len(data)}, f)
+
+    def download(self):
+        return get_text(asyncio.run(tool_module.download_trello_asset.run({
+            "url": self.url, "output_path": self.output_path, "checksum": True
+        })))
+
+    def assertDownloaded(self, text):
+        with open(self.output_path, "rb") as f:
+            self.assertEqual(f.read(), AssetHandler.DATA)
+        self.assertIn(hashlib.sha256(AssetHandler.DATA).hexdigest(), text)
+        self.assertEqual(os.listdir(self.directory.name), ["attachment.bin"])
+
+    def test_resumes_from_partial_file(self):
+        self.write_partial(AssetHandler.DATA[:1000])
+        text = self.download()
+
+        self.assertIn(f"({len(AssetHandler.DATA) - 1000} bytes in ", text)
+        self.assertIn("Resumed a partial download at byte 1000", text)
+        self.assertEqual(self.server.requests[0]["Range"], "bytes=1000-")
+        self.assertEqual(self.server.requests[0]["If-Range"], AssetHandler.ETAG)
+        self.assertDownloaded(text)
+
+    def test_full_download_when_server_ignores_ranges(self):
+        self.server.ranges = False
+        self.write_partial(b"x" * 1000)
+        text = self.download()
+
+        self.assertIn(f"({len(AssetHandler.DATA)} bytes in ", text)
+        self.assertNotIn("Resumed", text)
+        self.assertDownloaded(text)
+
+    def test_full_download_when_etag_changed(self):
+        self.write_partial(b"x" * 1000, etag='"v1"')
+        text = self.download()
+
+        self.assertEqual(self.server.requests[0]["If-Range"], '"v1"')
+        self.assertNotIn("Resumed", text)
+        self.assertDownloaded(text)
+
+    def test_unsatisfiable_range_starts_over(self):
+        self.write_partial(AssetHandler.DATA + b"extra")
+        text = self.download()
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertNotIn("Range", self.server.requests[1])
+        self.assertDownloaded(text)
+
+    def test_mismatched_range_starts_over(self):
+        self.server.ranges = "from-start"
+        self.write_partial(b"x" * 1000)
+        text = self.download()
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertNotIn("Range", self.server.requests[1])
+        self.assertNotIn("Resumed", text)
+        self.assertDownloaded(text)
+
+    def test_partial_file_for_another_url_is_discarded(self):
+        self.write_partial(b"x" * 1000)
+        self.url += "?other"
+        text = self.download()
+
+        self.assertNotIn("Range", self.server.requests[0])
+        self.assertDownloaded(text)
+
+
+class SlowAssetHandler(AssetHandler):
+    """Serves DATA slowly, recording how many requests were in flight at once."""
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.active += 1
+            self.server.peak = max(self.server.peak, self.server.active)
+        time.sleep(0.1)
+        with self.server.lock:
+            self.server.active -= 1
+        super().do_GET()
+
+
+@patch.dict(os.environ, {"TRELLO_API_KEY": "fake_key", "TRELLO_TOKEN": "fake_token"})
+class TestBatchDownload(LocalServerTestCase):
+
+    handler = SlowAssetHandler
+
+    def setUp(self):
+        super().setUp()
+        self.server.lock = threading.Lock()
+        self.server.active = self.server.peak = 0
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_downloads_all_items_with_per_host_limit(self):
+        items = [
+            {"url": f"{self.base}/file{i}", "output_path": os.path.join(self.directory.name, f"file{i}")}
+            for i in range(6)
+        ]
+        items.insert(2, {"url": f"{self.base}/missing", "output_path": os.path.join(self.directory.name, "missing")})
+        items.append({"url": f"{self.base}/file9"})
+
+        with patch.object(impl_module, "PER_HOST_CONCURRENCY", 2):
+            res = asyncio.run(tool_module.download_trello_assets.run({"items": items}))
+        results = json.loads(get_text(res))
+
+        self.assertEqual([r["status"] for r in results], ["ok", "ok", "error", "ok", "ok", "ok", "ok", "error"])
+        self.assertEqual(results[2]["error"], "HTTP Error 404: Not Found")
+        self.assertIn("needs a url and an output_path", results[7]["error"])
+        self.assertEqual([r["url"] for r in results], [item["url"] for item in items])
+        self.assertEqual(self.server.peak, 2)
+        for i in range(6):
+            with open(os.path.join(self.directory.name, f"file{i}"), "rb") as f:
+                self.assertEqual(f.read(), AssetHandler.DATA)
+
+    def test_duplicate_output_paths_are_rejected(self):
+        output_path = os.path.join(self.directory.name, "same")
+        items = [{"url": f"{self.base}/a", "output_path": output_path}, {"url": f"{self.base}/b", "output_path": output_path}]
+
+        results = json.loads(get_text(asyncio.run(tool_module.download_trello_assets.run({"items": items}))))
+
+        self.assertEqual([r["status"] for r in results], ["error", "error"])
+        self.assertEqual(self.server.requests, [])
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_missing_env_vars(self):
+        res = asyncio.run(tool_module.download_trello_assets.run({"items": []}))
+        self.assertIn("Error: TRELLO_API_KEY", get_text(res))
+
+
+@patch.dict(os.environ, {"TRELLO_API_KEY": "fake_key", "TRELLO_TOKEN": "fake_token"})
+class TestAssetCache(LocalServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_directory = tempfile.TemporaryDirectory()
+        self.patch = patch.object(impl_module.cache, "directory", self.cache_directory.name)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.directory.cleanup()
+        self.cache_directory.cleanup()
+
+    def download(self, name, url=None):
+        output_path = os.path.join(self.directory.name, name)
+        text = get_text(asyncio.run(tool_module.download_trello_asset.run({
+            "url": url or f"{self.base}/file", "output_path": output_path, "checksum": True
+        })))
+        return text, output_path
+
+    def stats(self):
+        return json.loads(get_text(asyncio.run(tool_module.trello_cache_stats.run({}))))
+
+    def test_not_modified_asset_comes_from_cache(self):
+        self.download("first.bin")
+        text, output_path = self.download("second.bin")
+
+        self.assertIn(f"(not modified, {len(AssetHandler.DATA)} bytes from the cache)", text)
+        self.assertIn(hashlib.sha256(AssetHandler.DATA).hexdigest(), text)
+        self.assertEqual(self.server.requests[1]["If-None-Match"], AssetHandler.ETAG)
+        with open(output_path, "rb") as f:
+            self.assertEqual(f.read(), AssetHandler.DATA)
+        stats = self.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["bytes_saved"]), (1, 1, len(AssetHandler.DATA)))
+        self.assertEqual((stats["entries"], stats["bytes"]), (1, len(AssetHandler.DATA)))
+
+    def test_editing_a_download_does_not_change_the_cache(self):
+        _, first_path = self.download("first.bin")
+        with open(first_path, "r+b") as f:
+            f.write(b"edited")
+        text, second_path = self.download("second.bin")
+        with open(second_path, "r+b") as f:
+            f.write(b"edited")
+        text, third_path = self.download("third.bin")
+
+        self.assertIn("from the cache", text)
+        with open(third_path, "rb") as f:
+            self.assertEqual(f.read(), AssetHandler.DATA)
+
+    def test_entry_evicted_before_restore_is_fetched_again(self):
+        self.download("first.bin")
+        lookup = impl_module.cache.lookup
+
+        def lookup_then_evict(url):
+            entry = lookup(url)
+            # Another download evicts the entry between the lookup and the 304
+            os.remove(entry["path"])
+            return entry
+
+        with patch.object(impl_module.cache, "lookup", lookup_then_evict):
+            text, output_path = self.download("second.bin")
+
+        self.assertNotIn("from the cache", text)
+        self.assertEqual(self.server.requests[1]["If-None-Match"], AssetHandler.ETAG)
+        self.assertNotIn("If-None-Match", self.server.requests[2])
+        with open(output_path, "rb") as f:
+            self.assertEqual(f.read(), AssetHandler.DATA)
+        self.assertEqual(self.stats()["entries"], 1)
+
+    def test_store_copies_without_holding_the_lock(self):
+        copyfile = shutil.copyfile
+
+        def checked_copyfile(source, destination):
+            self.assertFalse(impl_module.cache._lock.locked())
+            return copyfile(source, destination)
+
+        with patch.object(impl_module.shutil, "copyfile", checked_copyfile):
+            self.download("first.bin")
+        self.assertEqual(self.stats()["entries"], 1)
+        self.assertEqual([name for name in os.listdir(self.cache_directory.name) if name.endswith(".tmp")], [])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        with patch.object(impl_module.cache, "max_bytes", len(AssetHandler.DATA) * 2):
+            self.download("a.bin", f"{self.base}/a")
+            self.download("b.bin", f"{self.base}/b")
+            # Using a makes b the least recently used entry
+            self.download("a2.bin", f"{self.base}/a")
+            self.download("c.bin", f"{self.base}/c")
+
+            self.assertIsNotNone(impl_module.cache.lookup(f"{self.base}/a"))
+            self.assertIsNone(impl_module.cache.lookup(f"{self.base}/b"))
+            self.assertEqual(self.stats()["entries"], 2)
+
+    def test_disabled_cache_sends_no_conditional_headers(self):
+        with patch.object(impl_module.cache, "max_bytes", 0):
+            self.download("first.bin")
+            text, _ = self.download("second.bin")
+
+        self.assertNotIn("If-None-Match", self.server.requests[1])
+        self.assertNotIn("from the cache", text)
+        self.assertEqual(os.listdir(self.cache_directory.name), [])
+
+
+class TrelloApiHandler(AssetHandler):
+    """Answers Trello REST API paths (/1/...) from server.api, and serves files for everything else."""
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if not path.startswith("/1/"):
+            return super().do_GET()
+        self.server.requests.append(dict(self.headers, path=self.path))
+        body = json.dumps(self.server.api[path]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@patch.dict(os.environ, {"TRELLO_API_KEY": "fake_key", "TRELLO_TOKEN": "fake_token"})
+class TestAttachmentSync(LocalServerTestCase):
+
+    DATE = "2024-05-06T07:08:09.123Z"
+    handler = TrelloApiHandler
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.patch = patch.object(impl_module, "API_URL", f"{self.base}/1")
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.directory.cleanup()
+
+    def attachment(self, attachment_id, name, path="file", size=len(AssetHandler.DATA), upload=True):
+        return {"id": attachment_id, "name": name, "bytes": size, "mimeType": "image/png", "date": self.DATE,
+                "url": f"{self.base}/{attachment_id}/{path}", "isUpload": upload}
+
+    def run_tool(self, tool, args):
+        return json.loads(get_text(asyncio.run(getattr(tool_module, tool).run(args))))
+
+    def test_card_attachments_are_downloaded_then_skipped(self):
+        self.server.api = {"/1/cards/card1/attachments": [
+            self.attachment("a1", "photo.png"),
+            self.attachment("a2", "../notes.txt"),
+            self.attachment("a3", "https://example.com", upload=False),
+        ]}
+        args = {"card_id": "card1", "dest_dir": self.directory.name}
+
+        first = self.run_tool("download_card_attachments", args)
+        self.assertEqual((first["downloaded"], first["skipped"], first["failed"]), (2, 0, 0))
+        self.assertEqual(sorted(os.listdir(self.directory.name)), [".._notes.txt", "photo.png"])
+        api_request = self.server.requests[0]
+        self.assertIn("Authorization", api_request)
+        self.assertIn("fields=id%2Cname%2Cbytes%2CmimeType%2Cdate", api_request["path"])
+        photo = os.path.join(self.directory.name, "photo.png")
+        self.assertEqual(os.stat(photo).st_mtime, datetime.fromisoformat("2024-05-06T07:08:09.123+00:00").timestamp())
+
+        second = self.run_tool("download_card_attachments", args)
+        self.assertEqual((second["downloaded"], second["skipped"]), (0, 2))
+
+        # A file with a different size is downloaded again
+        with open(photo, "ab") as f:
+            f.write(b"changed")
+        third = self.run_tool("download_card_attachments", args)
+        self.assertEqual((third["downloaded"], third["skipped"]), (1, 1))
+        with open(photo, "rb") as f:
+            self.assertEqual(f.read(), AssetHandler.DATA)
+
+    def test_board_attachments_go_to_a_directory_per_card(self):
+        self.server.api = {"/1/boards/board1/cards": [
+            {"id": "c1", "name": "Design / mockups", "attachments": [self.attachment("a1", "same.png"), self.attachment("a2", "same.png")]},
+            {"id": "c2", "name": "Bug", "attachments": [self.attachment("a3", "log.txt", path="missing")]},
+            {"id": "c3", "name": "Empty", "attachments": []},
+        ]}
+
+        result = self.run_tool("download_board_attachments", {"board_id": "board1", "dest_dir": self.directory.name})
+
+        self.assertEqual((result["downloaded"], result["skipped"], result["failed"]), (2, 0, 1))
+        self.assertEqual(sorted(os.listdir(self.directory.name)), ["Bug-c2", "Design _ mockups-c1"])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory.name, "Design _ mockups-c1"))), ["a2-same.png", "same.png"])
+        self.assertEqual([r["error"] for r in result["results"] if r["status"] == "error"], ["HTTP Error 404: Not Found"])
+        self.assertIn("attachments=true", self.server.requests[0]["path"])
+
+
+class FlakyHandler(AssetHandler):
+    """Answers with the statuses in server.failures (with server.failure_headers) before serving DATA."""
+
+    def do_GET(self):
+        if not self.server.failures:
+            return super().do_GET()
+        self.server.requests.append(dict(self.headers))
+        self.send_response(self.server.failures.pop(0))
+        for name, value in self.server.failure_headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class TestRateLimiting(LocalServerTestCase):
+
+    handler = FlakyHandler
+
+    def setUp(self):
+        super().setUp()
+        self.server.failures = []
+        self.server.failure_headers = {}
+        self.url = f"{self.base}/file"
+        self.patches = [
+            patch.object(impl_module, "BACKOFF_BASE", 0.01),
+            patch.object(impl_module, "rate_limiter", tool_module.RateLimiter()),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def get(self):
+        with tool_module.trello_get(self.url, {}) as response:
+            return response.read()
+
+    def test_bucket_spreads_requests_over_the_interval(self):
+        bucket = tool_module.TokenBucket(20, 1.0)
+        # A tenth of the limit starts at once, the rest at 18 per second
+        delays = [bucket.reserve() for _ in range(4)]
+        self.assertEqual(delays[:2], [0.0, 0.0])
+        self.assertAlmostEqual(delays[2], 1 / 18, places=2)
+        self.assertAlmostEqual(delays[3], 2 / 18, places=2)
+
+    def test_limits_fit_a_rolling_window(self):
+        for limit in (100, 300):
+            capacity, rate = tool_module.TokenBucket.shape(limit, 10)
+            self.assertLessEqual(capacity + rate * 10, limit)
+
+    def test_server_limit_headers_are_applied(self):
+        limiter = tool_module.RateLimiter()
+        limiter.observe("k", "t", {
+            "x-rate-limit-api-token-max": "10", "x-rate-limit-api-token-interval-ms": "1000",
+            "x-rate-limit-api-token-remaining": "0",
+        })
+        bucket = limiter.buckets("k", "t")["token"]
+        self.assertEqual(bucket.rate, 9)
+        self.assertGreater(bucket.reserve(), 0)
+
+    def test_retries_429_and_5xx(self):
+        self.server.failures = [429, 503, 500]
+        self.server.failure_headers = {"Retry-After": "0"}
+
+        self.assertEqual(self.get(), AssetHandler.DATA)
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.failures = [503] * 3
+        with patch.object(impl_module, "MAX_RETRIES", 2):
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                self.get()
+        self.assertEqual(raised.exception.code, 503)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        with self.assertRaises(urllib.error.HTTPError):
+            with tool_module.trello_get(self.url.replace("/file", "/missing"), {}):
+                pass
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_backoff_honours_retry_after(self):
+        self.assertGreaterEqual(tool_module.backoff_delay(0, {"Retry-After": "3"}), 3)
+        self.assertLessEqual(tool_module.backoff_delay(3), 0.08)
+        http_date = email.utils.formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(tool_module.retry_after({"Retry-After": http_date}), 30, delta=2)
+
+
+class TestConnectionPool(LocalServerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        tool_module.pool.clear()
+
+    def tearDown(self):
+        tool_module.pool.clear()
+
+    def get(self, url, headers=None):
+        with tool_module.open_url(url, headers or {}) as response:
+            return response.read()
+
+    def test_connection_is_reused(self):
+        for _ in range(3):
+            self.assertEqual(self.get(f"{self.base}/file"), AssetHandler.DATA)
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_idle_connections_expire(self):
+        self.get(f"{self.base}/file")
+        with patch.object(tool_module.pool, "idle_timeout", 0):
+            self.get(f"{self.base}/file")
+        self.assertEqual(len(self.server.clients), 2)
+
+    def test_connection_closed_by_server_is_replaced(self):
+        self.get(f"{self.base}/file")
+        # The server closes the connection after this response without saying so beforehand.
+        with patch.object(tool_module.PooledResponse, "close", lambda response: tool_module.pool.release(response._key, response._connection)):
+            self.get(f"{self.base}/close")
+        time.sleep(0.1)
+        self.assertEqual(self.get(f"{self.base}/file"), AssetHandler.DATA)
+
+    def test_redirect_to_other_host_drops_authorization(self):
+        data = self.get(f"{self.base}/redirect", {"Authorization": "OAuth secret", "User-Agent": "test"})
+
+        self.assertEqual(data, AssetHandler.DATA)
+        self.assertEqual(self.server.requests[0]["Authorization"], "OAuth secret")
+        self.assertNotIn("Authorization", self.server.requests[1])
+        self.assertEqual(self.server.requests[1]["User-Agent"], "test")
+        self.assertEqual(self.server.requests[1]["Host"], f"localhost:{self.server.server_port}")
+
+    def test_proxy_falls_back_to_urlopen(self):
+        proxy = "http://127.0.0.1:9"
+        with patch.dict(os.environ, {"http_proxy": proxy, "https_proxy": proxy, "no_proxy": ""}):
+            with patch("urllib.request.urlopen") as mock_urlopen:
+                response = tool_module.open_url(f"{self.base}/file", {"Authorization": "OAuth secret"})
+
+        self.assertIs(response, mock_urlopen.return_value)
+        request = mock_urlopen.call_args.args[0]
+        self.assertEqual(request.full_url, f"{self.base}/file")
+        self.assertEqual(request.get_header("Authorization"), "OAuth secret")
+        self.assertEqual(self.server.requests, [])
+
+    def test_error_status_raises_http_error(self):
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            self.get(f"{self.base}/missing")
+        self.assertEqual(raised.exception.code, 404)
+        # The error body was drained, so the connection is reused.
+        self.get(f"{self.base}/file")
+        self.assertEqual(len(self.server.clients), 1)
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,7 +1,17 @@
 import unittest
 from unittest.mock import patch, MagicMock, call
+import io
 import os
+import re
 import sys
+import time
+import asyncio
+import collections
+import inspect
+import tempfile
+import threading
+import subprocess
+import json
 
 # Add directory to path to import tmux_manager
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -13,7 +23,15 @@ class TestTmuxExternalLogic(unittest.TestCase):
     def setUp(self):
         # Reset the global state
         tool_module.CREATED_SESSION = False
-        
+        tool_module.session_cache.invalidate()
+        # These tests cover the subprocess path
+        tool_module.close_control_client()
+        self._control_mode = tool_module.CONTROL_MODE_ENABLED
+        tool_module.CONTROL_MODE_ENABLED = False
+
+    def tearDown(self):
+        tool_module.CONTROL_MODE_ENABLED = self._control_mode
+
     @patch.dict(os.environ, {}, clear=True)
     @patch('subprocess.run')
     def test_ensure_session_creates_session_if_missing(self, mock_run):
@@ -49,6 +67,10 @@ class TestTmuxExternalLogic(unittest.TestCase):
         target = tool_module.resolve_target("othersession:1")
         self.assertEqual(target, "othersession:1")
 
+        # Unique ids
+        self.assertEqual(tool_module.resolve_target("%12"), "%12")
+        self.assertEqual(tool_module.resolve_target("@3"), "@3")
+
     @patch.dict(os.environ, {"TMUX": "something"})
     def test_resolve_target_inside_tmux(self):
         # Should return raw target
@@ -71,5 +93,753 @@ class TestTmuxExternalLogic(unittest.TestCase):
         # run_tmux_command calls the command
         self.assertEqual(mock_run.call_args_list[1].args[0], ["tmux", "list-windows"])
 
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('subprocess.run')
+    def test_session_state_is_cached(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0, stdout="", stderr="")
+
+        tool_module.resolve_target("1")
+        tool_module.run_tmux_command(["list-windows", "-t", f"{tool_module.MCP_SESSION_NAME}:"])
+        tool_module.run_tmux_command(["list-windows", "-t", f"{tool_module.MCP_SESSION_NAME}:"])
+
+        args_list = [c.args[0] for c in mock_run.call_args_list]
+        self.assertEqual(args_list.count(["tmux", "has-session", "-t", tool_module.MCP_SESSION_NAME]), 1)
+        self.assertEqual(len(args_list), 3)
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('subprocess.run')
+    def test_session_state_expires(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0)
+
+        with patch.object(tool_module, 'SESSION_CACHE_TTL', 0):
+            tool_module.ensure_session()
+            tool_module.ensure_session()
+
+        self.assertEqual(mock_run.call_count, 2)
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('subprocess.run')
+    def test_missing_session_invalidates_cache_and_retries(self, mock_run):
+        missing = f"can't find session: {tool_module.MCP_SESSION_NAME}"
+        mock_run.side_effect = [
+            MagicMock(returncode=0), # has-session
+            MagicMock(returncode=1, stdout="", stderr=missing), # command: session was killed externally
+            MagicMock(returncode=1), # has-session
+            MagicMock(returncode=0), # new-session
+            MagicMock(returncode=0, stdout="0: bash\n", stderr=""), # command retried
+        ]
+
+        output = tool_module.run_tmux_command(["list-windows", "-t", f"{tool_module.MCP_SESSION_NAME}:"])
+
+        self.assertEqual(output, "0: bash")
+        self.assertTrue(tool_module.CREATED_SESSION)
+        self.assertTrue(tool_module.session_cache.session_known())
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('subprocess.run')
+    def test_topology_is_cached_until_layout_changes(self, mock_run):
+        mock_run.return_value = MagicMock(returncode=0, stdout="s\t%1\t@1\t0\tbash\t0\n", stderr="")
+
+        panes = tool_module.get_topology()
+        tool_module.get_topology()
+        self.assertEqual(panes, [{
+            "session_name": "s", "pane_id": "%1", "window_id": "@1", "window_index": 0, "window_name": "bash", "pane_index": 0
+        }])
+        list_calls = [c for c in mock_run.call_args_list if c.args[0][1] == "list-panes"]
+        self.assertEqual(len(list_calls), 1)
+
+        tool_module.run_tmux_command(["split-window", "-t", f"{tool_module.MCP_SESSION_NAME}:"])
+        tool_module.get_topology()
+        list_calls = [c for c in mock_run.call_args_list if c.args[0][1] == "list-panes"]
+        self.assertEqual(len(list_calls), 2)
+
+
+class TestTmuxControlMode(unittest.TestCase):
+
+    def make_client(self, stdout_text):
+        client = tool_module.TmuxControlClient("session")
+        client.process = MagicMock()
+        client.process.poll.return_value = None
+        client.process.stdout = io.StringIO(stdout_text)
+        return client
+
+    def test_quote_tmux_argument(self):
+        self.assertEqual(tool_module.quote_tmux_argument("plain"), '"plain"')
+        self.assertEqual(
+            tool_module.quote_tmux_argument('a "b" $HOME ~ \\ x\ny'),
+            '"a \\"b\\" \\$HOME \\~ \\\\ x\\ny"'
+        )
+
+    def test_replies_are_matched_to_commands_in_order(self):
+        client = self.make_client(
+            "%sessions-changed\n"
+            "%begin 100 1 1\n"
+            "first\n"
+            "%end 999 9 1\n"  # pane content that looks like a guard line
+            "%end 100 1 1\n"
+            "%begin 100 2 0\n"  # not ours
+            "%end 100 2 0\n"
+            "%begin 100 3 1\n"
+            "can't find window: nope\n"
+            "%error 100 3 1\n"
+        )
+        first, second = client.submit([["capture-pane", "-p"], ["select-window", "-t", "nope"]])
+        client._read_loop()
+
+        self.assertEqual(first.result(timeout=1), (True, "first\n%end 999 9 1\n"))
+        self.assertEqual(second.result(timeout=1), (False, "can't find window: nope\n"))
+        written = client.process.stdin.write.call_args.args[0]
+        self.assertEqual(written, '"capture-pane" "-p"\n"select-window" "-t" "nope"\n')
+        self.assertTrue(client.established)
+
+    def test_undelivered_commands_fail_when_client_exits(self):
+        client = self.make_client("%exit\n")
+        future = client.submit([["list-windows"]])[0]
+        client._read_loop()
+
+        with self.assertRaises(tool_module.ControlModeUnavailable):
+            future.result(timeout=1)
+        self.assertFalse(client.is_alive())
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('subprocess.run')
+    @patch.object(tool_module, 'run_control_command')
+    def test_run_tmux_command_prefers_control_client(self, mock_control, mock_run):
+        mock_run.return_value = MagicMock(returncode=0)
+        mock_control.return_value = (True, "0: bash\n")
+
+        self.assertEqual(tool_module.run_tmux_command(["list-windows"]), "0: bash")
+        self.assertNotIn(["tmux", "list-windows"], [c.args[0] for c in mock_run.call_args_list])
+
+        mock_control.return_value = None
+        mock_run.return_value = MagicMock(returncode=0, stdout="fallback\n")
+        self.assertEqual(tool_module.run_tmux_command(["list-windows"]), "fallback")
+
+class FakePane:
+    """Emulates the display-message and capture-pane replies of a pane with a bounded history."""
+
+    def __init__(self, height=3, history_limit=5):
+        self.height = height
+        self.history_limit = history_limit
+        self.rows = []
+
+    def write(self, *lines):
+        self.rows.extend(lines)
+        overflow = len(self.rows) - self.height - self.history_limit
+        if overflow > 0:
+            del self.rows[:overflow]
+
+    @property
+    def history_size(self):
+        return max(len(self.rows) + 1 - self.height, 0)
+
+    def execute(self, args):
+        cursor_y = len(self.rows) - self.history_size
+        if args[0] == "display-message":
+            return True, f"%7 {self.history_size} {cursor_y}\n"
+        start = args[args.index("-S") + 1]
+        start = 0 if start == "-" else int(start) + self.history_size
+        end = int(args[args.index("-E") + 1]) + self.history_size
+        return True, "".join(f"{line}\n" for line in self.rows[start:end + 1])
+
+
+class TestDeltaCapture(unittest.TestCase):
+
+    def setUp(self):
+        tool_module._pane_cursors.clear()
+        self.pane = FakePane()
+        patcher = patch.object(tool_module, 'execute_tmux', side_effect=self.pane.execute)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def capture(self, since):
+        header, *lines = tool_module.capture_pane_delta("session:1", since).split("\n")
+        return header, lines
+
+    def test_returns_only_new_lines(self):
+        self.pane.write("a", "b")
+        header, lines = self.capture("0")
+        self.assertEqual((header, lines), ("[cursor %7:2]", ["a", "b"]))
+
+        header, lines = self.capture("%7:2")
+        self.assertEqual((header, lines), ("[cursor %7:2]", []))
+
+        self.pane.write("c", "d", "e", "f")
+        header, lines = self.capture("%7:2")
+        self.assertEqual((header, lines), ("[cursor %7:6]", ["c", "d", "e", "f"]))
+
+    def test_detects_wrapped_history(self):
+        self.pane.write(*[f"line{i}" for i in range(10)])
+        header, _ = self.capture("0")
+        cursor = header[len("[cursor "):-1]
+
+        # History is full: the cursor row stays the same while lines scroll off the top
+        self.pane.write("x1", "x2")
+        header, lines = self.capture(cursor)
+        self.assertEqual((header, lines), (f"[cursor {cursor}]", ["x1", "x2"]))
+
+        # More output than the history holds: the previous position is gone
+        self.pane.write(*[f"y{i}" for i in range(20)])
+        header, lines = self.capture(cursor)
+        self.assertEqual(header, f"[cursor {cursor} reset]")
+        self.assertEqual(lines[-1], "y19")
+
+    def test_detects_cleared_pane(self):
+        self.pane.write("a", "b", "c", "d")
+        self.capture("0")
+        self.pane.rows = ["fresh"]
+        header, lines = self.capture("%7:4")
+        self.assertEqual((header, lines), ("[cursor %7:1 reset]", ["fresh"]))
+
+    def test_rejects_cursor_of_another_pane(self):
+        header, _ = self.capture("%9:4")
+        self.assertIn("belongs to pane %9", header)
+
+
+class TestWaitForOutput(unittest.TestCase):
+
+    def fake_tmux(self, output_chunks):
+        """Answers display-message and writes output_chunks to the FIFO that pipe-pane is asked to feed."""
+        self.commands = []
+
+        def execute(args):
+            self.commands.append(args)
+            if args[0] == "display-message":
+                return True, "%4 0\n"
+            if args[0] == "pipe-pane" and len(args) > 3:
+                path = args[-1].split("> ", 1)[1]
+
+                def write():
+                    try:
+                        with open(path, "wb") as fifo:
+                            for chunk in output_chunks:
+                                time.sleep(0.05)
+                                fifo.write(chunk)
+                                fifo.flush()
+                    except BrokenPipeError:
+                        pass
+                threading.Thread(target=write, daemon=True).start()
+            return True, ""
+        return execute
+
+    def test_returns_matching_line_with_context(self):
+        chunks = [b"compiling a\r\ncompil", b"ing b\r\n\x1b[32mBUILD SUCC", b"EEDED\x1b[0m\r\n"]
+        with patch.object(tool_module, 'execute_tmux', side_effect=self.fake_tmux(chunks)):
+            result = tool_module.wait_for_output("session:1", r"BUILD \w+", timeout=5, context_lines=1)
+
+        self.assertTrue(result.startswith("Matched 'BUILD \\w+' in pane %4"))
+        self.assertTrue(result.endswith("compiling b\nBUILD SUCCEEDED"))
+        # The pipe is closed afterwards
+        self.assertEqual(self.commands[-1], ["pipe-pane", "-t", "%4"])
+
+    def test_matches_prompt_without_newline(self):
+        with patch.object(tool_module, 'execute_tmux', side_effect=self.fake_tmux([b"Password: "])):
+            result = tool_module.wait_for_output("session:1", "Password:", timeout=5, context_lines=0)
+
+        self.assertTrue(result.endswith(":\nPassword: "))
+
+    def test_times_out_with_last_output(self):
+        with patch.object(tool_module, 'execute_tmux', side_effect=self.fake_tmux([b"still running\n"])):
+            result = tool_module.wait_for_output("session:1", "done", timeout=0.5, context_lines=3)
+
+        self.assertTrue(result.startswith("Timeout: 'done' did not appear in pane %4"))
+        self.assertIn("still running", result)
+
+    def test_invalid_pattern(self):
+        self.assertIn("Invalid pattern", tool_module.wait_for_output("session:1", "(", 1, 1))
+
+
+class TestTrackedCommands(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(tool_module.remove_job_directory)
+
+    def test_wrapped_command_records_exit_code_and_signals_channel(self):
+        # A stand-in for tmux that records how it was called
+        with open(os.path.join(self.directory, "tmux"), "w") as f:
+            f.write('#!/bin/sh\necho "$@" > "$(dirname "$0")/signalled"\n')
+        os.chmod(os.path.join(self.directory, "tmux"), 0o755)
+        status_path = os.path.join(self.directory, "job.status")
+
+        wrapped = tool_module.wrap_tracked_command("echo 'quoted'; exit 3", status_path, "mcptools-job-1")
+        env = {"PATH": f"{self.directory}:{os.environ['PATH']}", "SHELL": "/bin/sh"}
+        subprocess.run(wrapped, shell=True, env=env, capture_output=True)
+
+        with open(status_path) as f:
+            self.assertEqual(f.read().strip(), "3")
+        with open(os.path.join(self.directory, "signalled")) as f:
+            self.assertEqual(f.read().strip(), "wait-for -S mcptools-job-1")
+
+    @patch('subprocess.run')
+    @patch.object(tool_module, 'execute_tmux')
+    def test_wait_for_job_reports_exit_code_and_tail(self, mock_execute, mock_run):
+        status_path = os.path.join(tool_module.get_job_directory(), "abc.status")
+        with open(status_path, "w") as f:
+            f.write("0\n")
+        tool_module._jobs["abc"] = {
+            "command": "make", "pane_id": "%5", "channel": "mcptools-job-abc",
+            "status_path": status_path, "started": time.time() - 2,
+        }
+        mock_execute.return_value = (True, "\n".join([
+            "cc main.c", "done", "", tool_module.KEEP_OPEN_SEPARATOR, tool_module.KEEP_OPEN_PROMPT, "", ""
+        ]))
+
+        result = tool_module.wait_for_job("abc", timeout=10, tail_lines=5)
+
+        self.assertTrue(result.startswith("Job abc exited with code 0 after"))
+        self.assertTrue(result.endswith("Last output:\ncc main.c\ndone"))
+        # Already finished, so there is nothing to wait for
+        mock_run.assert_not_called()
+
+        # The finished job and its status file are released
+        self.assertNotIn("abc", tool_module._jobs)
+        self.assertFalse(os.path.exists(status_path))
+        self.assertEqual(tool_module.wait_for_job("abc", timeout=0, tail_lines=5), "Error: Unknown job 'abc'.")
+
+    @patch('subprocess.run')
+    @patch.object(tool_module, 'execute_tmux', return_value=(True, "%5\n"))
+    def test_wait_for_job_still_running(self, mock_execute, mock_run):
+        tool_module._jobs["abc"] = {
+            "command": "make", "pane_id": "%5", "channel": "mcptools-job-abc",
+            "status_path": os.path.join(self.directory, "missing.status"), "started": time.time(),
+        }
+
+        result = tool_module.wait_for_job("abc", timeout=1, tail_lines=5)
+
+        self.assertIn("still running", result)
+        self.assertIn("abc", tool_module._jobs)
+        self.assertEqual(mock_run.call_args.args[0], ["tmux", "wait-for", "mcptools-job-abc"])
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        tool_module.session_cache.invalidate()
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch('subprocess.run')
+    def test_chain_attributes_output_and_failure(self, mock_run):
+        def run(argv, **kwargs):
+            if argv[1] == "has-session":
+                return MagicMock(returncode=0)
+            marker = argv[argv.index("display-message") + 2]
+            # The second command fails, so tmux stops there
+            return MagicMock(returncode=1, stdout=f"{marker}\n", stderr="can't find window: nope\n")
+        mock_run.side_effect = run
+
+        with patch.object(tool_module, 'get_control_client', return_value=None):
+            replies = tool_module.execute_tmux_batch([
+                ["send-keys", "-t", "s:1", "echo hi;", "Enter"],
+                ["select-window", "-t", "s:nope"],
+                ["kill-pane", "-t", "s:1.1"],
+            ])
+
+        self.assertEqual(replies, [(True, ""), (False, "can't find window: nope\n"), None])
+        argv = mock_run.call_args.args[0]
+        self.assertEqual(argv[:6], ["tmux", "send-keys", "-t", "s:1", "echo hi\\;", "Enter"])
+        self.assertEqual(argv.count(";"), 5)
+
+    @patch.object(tool_module, 'execute_tmux_batch')
+    @patch.object(tool_module, 'resolve_target', side_effect=lambda target=None: f"s:{target or ''}")
+    def test_batch_tool_reports_each_operation(self, mock_resolve, mock_batch):
+        mock_batch.return_value = [(True, ""), (False, "no space for new pane\n"), None]
+
+        res = asyncio.run(tool_module.tmux_batch.run({"operations": [
+            {"op": "new_window", "command": "htop", "name": "mon", "keep_open": False},
+            {"op": "split_window", "target_pane": "mon", "direction": "horizontal"},
+            {"op": "send_keys", "keys": "'uptime' Enter", "target_pane": "mon.1"},
+        ]}))
+        results = json.loads(res.content[0].text)
+
+        self.assertEqual([r["status"] for r in results], ["ok", "error", "skipped"])
+        self.assertEqual(results[1]["error"], "no space for new pane")
+        commands = mock_batch.call_args.args[0]
+        self.assertEqual(commands[0], ["new-window", "-t", "s:", "-n", "mon", "htop"])
+        self.assertEqual(commands[1], ["split-window", "-h", "-t", "s:mon"])
+        self.assertEqual(commands[2], ["send-keys", "-t", "s:mon.1", "uptime", "Enter"])
+
+    def test_batch_rejects_unknown_operations_before_running(self):
+        with patch.object(tool_module, 'execute_tmux_batch') as mock_batch:
+            res = asyncio.run(tool_module.tmux_batch.run({"operations": [{"op": "reboot"}]}))
+        self.assertIn("unknown op 'reboot'", res.content[0].text)
+        mock_batch.assert_not_called()
+
+
+class TestCaptureBudget(unittest.TestCase):
+
+    def test_compact_collapses_repeated_lines(self):
+        lines = ["building   ", "\x1b[32m50%\x1b[0m", "\x1b[32m50%\x1b[0m", "\x1b[32m50%\x1b[0m", "", "", "done", "", ""]
+        self.assertEqual(
+            tool_module.compact_lines(lines, strip_ansi=True),
+            ["building", "50% ×3", "", "done"]
+        )
+        self.assertEqual(tool_module.compact_lines(lines)[1], "\x1b[32m50%\x1b[0m ×3")
+
+    def test_budget_keeps_most_recent_lines(self):
+        lines = [f"line {i}" for i in range(10)]
+        # The note counts against the budget
+        self.assertEqual(tool_module.apply_budget(lines, max_lines=3), ["[... 8 earlier lines omitted ...]", "line 8", "line 9"])
+        # Each line costs its length plus a newline
+        self.assertEqual(tool_module.apply_budget(lines, max_bytes=49), ["[... 8 earlier lines omitted ...]", "line 8", "line 9"])
+        # Without room for the note and a line, only lines are kept
+        self.assertEqual(tool_module.apply_budget(lines, max_lines=1), ["line 9"])
+        self.assertEqual(tool_module.apply_budget(lines, max_bytes=15), ["line 8", "line 9"])
+        self.assertEqual(tool_module.apply_budget(lines), lines)
+
+    def test_budget_is_never_exceeded(self):
+        lines = [f"{'é' * (i % 7)} line {i}" for i in range(200)]
+        for max_lines in (None, 0, 1, 2, 3, 10, 199, 200):
+            for max_bytes in (None, 0, 1, 10, 35, 36, 40, 100, 1000):
+                result = tool_module.apply_budget(lines, max_lines, max_bytes)
+                if max_lines is not None:
+                    self.assertLessEqual(len(result), max_lines)
+                if max_bytes is not None:
+                    self.assertLessEqual(len("\n".join(result).encode("utf-8")), max_bytes)
+
+    def test_budget_truncates_a_single_long_line(self):
+        self.assertEqual(tool_module.apply_budget(["x" * 100 + "end"], max_bytes=5), ["xxend"])
+
+    @patch.object(tool_module, 'resolve_target', return_value="s:1")
+    @patch.object(tool_module, 'run_tmux_command', return_value="a\nspin\nspin\nspin\nb\nc")
+    def test_capture_applies_budget_and_compaction(self, mock_command, mock_resolve):
+        res = asyncio.run(tool_module.tmux_capture_pane.run({"target_pane": "1", "compact": True, "max_lines": 3}))
+        self.assertEqual(res.content[0].text, "[... 2 earlier lines omitted ...]\nb\nc")
+
+    @patch.object(tool_module, 'resolve_target', return_value="s:1")
+    @patch.object(tool_module, 'capture_pane_delta', return_value="[cursor %1:5]\na\nb\nc\nd")
+    def test_delta_cursor_line_counts_against_budget(self, mock_delta, mock_resolve):
+        res = asyncio.run(tool_module.tmux_capture_pane.run({"target_pane": "1", "since": "0", "max_lines": 4}))
+        self.assertEqual(res.content[0].text, "[cursor %1:5]\n[... 2 earlier lines omitted ...]\nc\nd")
+
+    @patch.object(tool_module, 'resolve_target', return_value="s:1")
+    @patch.object(tool_module, 'run_tmux_command', return_value="\x1b[31mred\x1b[0m  \nplain")
+    def test_capture_strips_ansi_without_compaction(self, mock_command, mock_resolve):
+        res = asyncio.run(tool_module.tmux_capture_pane.run({"target_pane": "1", "escape_sequences": True, "strip_ansi": True}))
+        self.assertEqual(res.content[0].text, "red  \nplain")
+
+    def fake_capture(self, stdout, returncode=0, stderr=b""):
+        process = MagicMock()
+        process.stdout = io.BytesIO(stdout)
+        process.stderr = io.BytesIO(stderr)
+        process.returncode = returncode
+        return process
+
+    @patch.object(tool_module, 'CAPTURE_CHUNK_SIZE', 4)
+    @patch.object(tool_module, 'resolve_target', return_value="s:1")
+    @patch.object(tool_module, 'ensure_session')
+    @patch('subprocess.Popen')
+    def test_capture_streams_to_file(self, mock_popen, mock_ensure, mock_resolve):
+        data = "".join(f"line {i}\n" for i in range(20)).encode()
+        mock_popen.return_value = self.fake_capture(data)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "capture.txt")
+            res = asyncio.run(tool_module.tmux_capture_pane.run({"target_pane": "1", "start_line": "-", "output_path": path}))
+
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), data)
+        text = res.content[0].text
+        self.assertTrue(text.startswith(f"Captured 20 lines ({len(data)} bytes) to {path}\nLast 10 lines:\nline 10\n"))
+        self.assertTrue(text.endswith("line 19"))
+        self.assertEqual(mock_popen.call_args.args[0], ["tmux", "capture-pane", "-p", "-t", "s:1", "-S", "-"])
+
+    @patch.object(tool_module, 'resolve_target', return_value="s:9")
+    @patch.object(tool_module, 'ensure_session')
+    @patch('subprocess.Popen')
+    def test_capture_to_file_error_removes_file(self, mock_popen, mock_ensure, mock_resolve):
+        mock_popen.return_value = self.fake_capture(b"", 1, b"can't find window: 9\n")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "capture.txt")
+            res = asyncio.run(tool_module.tmux_capture_pane.run({"target_pane": "9", "output_path": path}))
+            self.assertFalse(os.path.exists(path))
+        self.assertEqual(res.content[0].text, "Tmux Error: can't find window: 9")
+
+
+class TestShellPool(unittest.TestCase):
+
+    def make_pool(self, eviction="fifo", ttl=60):
+        pool = tool_module.ShellPool(2, ttl, eviction)
+        pool.start = lambda: None
+        return pool
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_acquire_order_and_expiry(self):
+        pool = self.make_pool()
+        now = time.time()
+        pool._idle.extend([("@1", "%1", now - 120), ("@2", "%2", now - 2), ("@3", "%3", now - 1)])
+
+        self.assertEqual(pool.acquire(), ("@2", "%2"))
+        self.assertEqual(pool._expired, [("@1", "%1", now - 120)])
+
+        pool.lifo = True
+        self.assertEqual(pool.acquire(), ("@3", "%3"))
+        self.assertIsNone(pool.acquire())
+
+    @patch.dict(os.environ, {"TMUX": "/tmp/tmux-1/default,1,0"})
+    def test_disabled_inside_tmux(self):
+        pool = self.make_pool()
+        pool._idle.append(("@1", "%1", time.time()))
+        self.assertIsNone(pool.acquire())
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch.object(tool_module, 'run_tmux_command')
+    def test_refill_evict_and_close(self, mock_command):
+        pool = self.make_pool(ttl=10)
+        mock_command.side_effect = ["", "@4 %4", "@5 %5", "", ""]
+        pool._idle.append(("@1", "%1", time.time() - 20))
+
+        pool.evict_expired()
+        pool.refill()
+        self.assertEqual([shell[:2] for shell in pool._idle], [("@4", "%4"), ("@5", "%5")])
+        pool.close()
+
+        calls = [c.args[0] for c in mock_command.call_args_list]
+        self.assertEqual(calls[0], ["kill-window", "-t", "@1"])
+        self.assertEqual(calls[1][:2], ["new-window", "-d"])
+        self.assertEqual(calls[2][:2], ["new-window", "-d"])
+        self.assertEqual(calls[3:], [["kill-window", "-t", "@4"], ["kill-window", "-t", "@5"]])
+        self.assertEqual(pool.idle_count(), 0)
+
+    @patch.object(tool_module, 'execute_tmux_batch')
+    @patch.object(tool_module.shell_pool, 'acquire', return_value=("@7", "%7"))
+    def test_new_window_uses_pooled_shell(self, mock_acquire, mock_batch):
+        mock_batch.return_value = [(True, "")] * 4
+
+        res = asyncio.run(tool_module.tmux_new_window.run({"command": "make", "name": "build", "keep_open": False}))
+
+        self.assertIn("Started command in new window build: make", res.content[0].text)
+        self.assertEqual(mock_batch.call_args.args[0], [
+            ["rename-window", "-t", "@7", "build"],
+            ["send-keys", "-t", "%7", "-l", "make; exit"],
+            ["send-keys", "-t", "%7", "Enter"],
+            ["select-window", "-t", "@7"],
+        ])
+
+    @patch.object(tool_module, 'execute_tmux_batch')
+    @patch.object(tool_module.shell_pool, 'acquire', return_value=("@7", "%7"))
+    def test_unnamed_pooled_window_is_renamed_after_command(self, mock_acquire, mock_batch):
+        mock_batch.return_value = [(True, "")] * 5
+
+        asyncio.run(tool_module.tmux_new_window.run({"command": "/usr/bin/make -j4"}))
+
+        self.assertEqual(mock_batch.call_args.args[0][:2], [
+            ["rename-window", "-t", "@7", "make"],
+            ["set-option", "-w", "-t", "@7", "automatic-rename", "on"],
+        ])
+
+    @patch.object(tool_module, 'run_tmux_command', return_value="%9")
+    @patch.object(tool_module, 'execute_tmux_batch')
+    @patch.object(tool_module.shell_pool, 'acquire', return_value=("@7", "%7"))
+    def test_tracked_command_does_not_use_pooled_shell(self, mock_acquire, mock_batch, mock_command):
+        self.addCleanup(tool_module.remove_job_directory)
+        res = asyncio.run(tool_module.tmux_new_window.run({"command": "make", "track_exit": True}))
+
+        self.assertIn("(job ", res.content[0].text)
+        mock_acquire.assert_not_called()
+        mock_batch.assert_not_called()
+        self.assertEqual(mock_command.call_args.args[0][0], "new-window")
+
+    @patch.object(tool_module, 'run_tmux_command', return_value="")
+    @patch.object(tool_module, 'execute_tmux_batch', return_value=[(False, "can't find window: @7\n")])
+    @patch.object(tool_module.shell_pool, 'acquire', return_value=("@7", "%7"))
+    def test_new_window_falls_back_when_shell_is_gone(self, mock_acquire, mock_batch, mock_command):
+        asyncio.run(tool_module.tmux_new_window.run({"command": "make"}))
+
+        self.assertEqual(mock_command.call_args.args[0][0], "new-window")
+
+
+class TestBroadcastKeys(unittest.TestCase):
+
+    LISTING = "\n".join([
+        "s\t@1\t0\thosts\t%1\t0\t1\t1\tssh\t/\t11\t80\t24\t0",
+        "s\t@1\t0\thosts\t%2\t1\t0\t1\tssh\t/\t12\t80\t24\t0",
+        "s\t@1\t0\thosts\t%3\t2\t0\t1\tbash\t/\t13\t80\t24\t0",
+    ])
+
+    @patch.dict(os.environ, {"TMUX": "/tmp/tmux-1/default,1,0", "TMUX_PANE": "%1"})
+    @patch.object(tool_module, 'execute_tmux_batch')
+    @patch.object(tool_module, 'run_tmux_command')
+    def test_sends_to_matching_panes_of_a_window(self, mock_command, mock_batch):
+        mock_command.return_value = self.LISTING
+        mock_batch.return_value = [(True, ""), (False, "pane is dead\n")]
+
+        res = asyncio.run(tool_module.tmux_broadcast_keys.run({"keys": "'uptime' Enter", "window": "hosts", "command": "ssh"}))
+
+        self.assertEqual(json.loads(res.content[0].text), [
+            {"target": "%1", "status": "ok"},
+            {"target": "%2", "status": "error", "error": "pane is dead"},
+        ])
+        self.assertEqual(mock_command.call_args.args[0][:3], ["list-panes", "-t", "hosts"])
+        self.assertEqual(mock_batch.call_args.args[0], [
+            ["send-keys", "-t", "%1", "uptime", "Enter"],
+            ["send-keys", "-t", "%2", "uptime", "Enter"],
+        ])
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch.object(tool_module, 'execute_tmux_batch', return_value=[(True, "")] * 3)
+    @patch.object(tool_module, 'run_tmux_command')
+    @patch.object(tool_module, 'get_topology')
+    def test_session_panes_are_listed_live(self, mock_topology, mock_command, mock_batch):
+        mock_topology.return_value = [
+            {"session_name": "s", "pane_id": "%1", "window_id": "@1", "window_index": 0, "window_name": "hosts", "pane_index": 0}
+        ]
+        mock_command.return_value = self.LISTING
+
+        asyncio.run(tool_module.tmux_broadcast_keys.run({"keys": "Enter"}))
+
+        mock_topology.assert_not_called()
+        self.assertEqual(mock_command.call_args.args[0][:2], ["list-panes", "-s"])
+        self.assertEqual([c[2] for c in mock_batch.call_args.args[0]], ["%1", "%2", "%3"])
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch.object(tool_module, 'execute_tmux_batch')
+    @patch.object(tool_module, 'run_tmux_command')
+    def test_idle_pooled_shells_are_skipped(self, mock_command, mock_batch):
+        mock_command.return_value = self.LISTING
+        with patch.object(tool_module.shell_pool, '_idle', collections.deque([("@1", "%1", time.time())])):
+            res = asyncio.run(tool_module.tmux_broadcast_keys.run({"keys": "Enter"}))
+
+        self.assertEqual(res.content[0].text, "No panes matched.")
+        mock_batch.assert_not_called()
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch.object(tool_module, 'ensure_session')
+    @patch.object(tool_module, 'execute_tmux_batch', return_value=[(True, ""), (True, "")])
+    def test_explicit_targets_are_resolved(self, mock_batch, mock_ensure):
+        asyncio.run(tool_module.tmux_broadcast_keys.run({"keys": "C-c", "targets": ["1", "2.1"]}))
+
+        session = tool_module.MCP_SESSION_NAME
+        self.assertEqual(mock_batch.call_args.args[0], [
+            ["send-keys", "-t", f"{session}:1", "C-c"],
+            ["send-keys", "-t", f"{session}:2.1", "C-c"],
+        ])
+
+
+class TestSearchPanes(unittest.TestCase):
+
+    PANES = [
+        {"session_name": "s", "pane_id": f"%{i}", "window_id": f"@{i}", "window_index": i, "window_name": f"w{i}", "pane_index": 0}
+        for i in range(5)
+    ]
+
+    def test_reports_matches_with_context(self):
+        replies = [(True, "ok\nok\n"), (True, "make\nERROR: boom\nexit 2\n"), (False, "can't find pane: %2"), (True, ""), (True, "Error: case\n")]
+        with patch.object(tool_module, 'execute_tmux_batch', return_value=replies) as mock_batch:
+            result = tool_module.search_panes(re.compile("ERROR"), self.PANES, True, 10, 1)
+
+        self.assertEqual(result["panes_searched"], 5)
+        self.assertFalse(result["truncated"])
+        self.assertEqual(result["matches"], [{
+            "pane_id": "%1", "session_name": "s", "window_index": 1, "window_name": "w1",
+            "line": 1, "text": "ERROR: boom", "context": ["make", "ERROR: boom", "exit 2"],
+        }])
+        self.assertEqual(mock_batch.call_args.args[0][0], ["capture-pane", "-p", "-J", "-t", "%0", "-S", "-"])
+
+    @patch.object(tool_module, 'SEARCH_CHUNK_SIZE', 2)
+    def test_stops_once_enough_matches_are_found(self):
+        with patch.object(tool_module, 'execute_tmux_batch', side_effect=lambda commands, stop_on_error: [(True, "hit\n")] * len(commands)) as mock_batch:
+            result = tool_module.search_panes(re.compile("hit"), self.PANES, False, 3, 0)
+
+        self.assertEqual(len(result["matches"]), 3)
+        self.assertTrue(result["truncated"])
+        # The last chunk was never captured
+        self.assertEqual(mock_batch.call_count, 2)
+
+    @patch.dict(os.environ, {}, clear=True)
+    @patch.object(tool_module, 'search_panes', return_value={"matches": []})
+    @patch.object(tool_module, 'list_pane_topology')
+    def test_session_scope_is_listed_live(self, mock_list, mock_search):
+        mock_list.return_value = self.PANES
+        tool_module.session_cache.set_topology(self.PANES[:1])
+        self.addCleanup(tool_module.session_cache.invalidate)
+
+        asyncio.run(tool_module.tmux_search_panes.run({"pattern": "x"}))
+
+        self.assertEqual(mock_list.call_args.args[0][0], "-s")
+        self.assertEqual(mock_search.call_args.args[1], self.PANES)
+        self.assertEqual(tool_module.session_cache.topology(), self.PANES)
+
+    def test_invalid_pattern(self):
+        res = asyncio.run(tool_module.tmux_search_panes.run({"pattern": "["}))
+        self.assertIn("Invalid pattern", res.content[0].text)
+
+
+class TestListings(unittest.TestCase):
+
+    WINDOWS = "\n".join([
+        "s\t@1\t0\teditor\t0\t1\t1700000000\tvim\t101\t80\t24\t0",
+        "s\t@2\t1\tbuild\t1\t2\t1700000100\tmake\t102\t80\t24\t1500",
+        "s\t@3\t2\tbuild-docs\t0\t1\t1700000200\tbash\t103\t80\t24\t20",
+    ])
+
+    def list_windows(self, **params):
+        with patch.object(tool_module, 'resolve_target', return_value="s:"), \
+             patch.object(tool_module, 'run_tmux_command', return_value=self.WINDOWS) as mock_command:
+            res = asyncio.run(tool_module.tmux_list_windows.run(params))
+        self.assertIn(tool_module.list_format(tool_module.WINDOW_FIELDS), mock_command.call_args.args[0])
+        return json.loads(res.content[0].text)
+
+    def test_windows_are_structured(self):
+        result = self.list_windows()
+        self.assertEqual(result["total"], 3)
+        self.assertEqual(result["windows"][1], {
+            "session_name": "s", "window_id": "@2", "window_index": 1, "window_name": "build",
+            "window_active": True, "window_panes": 2, "window_activity": 1700000100,
+            "pane_current_command": "make", "pane_pid": 102, "pane_width": 80, "pane_height": 24,
+            "history_size": 1500,
+        })
+
+    def test_windows_are_filtered_and_paged(self):
+        result = self.list_windows(name="build", limit=1, offset=1)
+        self.assertEqual(result["total"], 2)
+        self.assertEqual([w["window_id"] for w in result["windows"]], ["@3"])
+
+        result = self.list_windows(command="vi", active=False)
+        self.assertEqual([w["window_id"] for w in result["windows"]], ["@1"])
+
+    def test_idle_pooled_shells_are_hidden(self):
+        pooled = self.WINDOWS + "\n" + "\n".join(
+            f"s\t@{i}\t{i - 1}\tmcptools-pool\t0\t1\t1700000300\tbash\t104\t80\t24\t0" for i in (4, 5)
+        )
+        with patch.object(tool_module, 'resolve_target', return_value="s:"), \
+             patch.object(tool_module, 'run_tmux_command', return_value=pooled), \
+             patch.object(tool_module.shell_pool, '_idle', collections.deque([("@4", "%4", time.time())])):
+            res = asyncio.run(tool_module.tmux_list_windows.run({}))
+        # @5 has the pool's name but was already handed out, so it is the user's window now
+        self.assertEqual([w["window_id"] for w in json.loads(res.content[0].text)["windows"]], ["@1", "@2", "@3", "@5"])
+
+    @patch.object(tool_module, 'run_tmux_command', return_value="")
+    def test_panes_cover_all_sessions_by_default(self, mock_command):
+        res = asyncio.run(tool_module.tmux_list_panes.run({}))
+        self.assertEqual(json.loads(res.content[0].text), {"total": 0, "offset": 0, "limit": 100, "panes": []})
+        self.assertIn("-a", mock_command.call_args.args[0])
+
+
+class TestAsyncTools(unittest.TestCase):
+
+    def test_tools_are_coroutines(self):
+        self.assertTrue(inspect.iscoroutinefunction(tool_module.tmux_capture_pane.fn))
+        self.assertTrue(inspect.iscoroutinefunction(tool_module.tmux_send_keys.fn))
+
+    @patch.object(tool_module, 'resolve_target', return_value="session:")
+    @patch.object(tool_module, 'run_tmux_command')
+    def test_slow_commands_do_not_block_each_other(self, mock_command, mock_resolve):
+        def slow_command(args):
+            time.sleep(0.3)
+            return "pane content"
+        mock_command.side_effect = slow_command
+
+        async def capture_all():
+            return await asyncio.gather(*[
+                tool_module.tmux_capture_pane.run({"target_pane": str(i)}) for i in range(4)
+            ])
+
+        start = time.monotonic()
+        results = asyncio.run(capture_all())
+        elapsed = time.monotonic() - start
+
+        self.assertEqual([r.content[0].text for r in results], ["pane content"] * 4)
+        self.assertLess(elapsed, 1.0)
+
 if __name__ == '__main__':
     unittest.main()
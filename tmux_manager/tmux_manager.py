@@ -1,8 +1,21 @@
 #!/usr/bin/env python3
 import os
+import re
+import time
+import codecs
+import select
+import shutil
+import asyncio
+import json
+import uuid
+import tempfile
+import functools
 import subprocess
 import shlex
 import atexit
+import threading
+import collections
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from fastmcp import FastMCP
 
 mcp = FastMCP("Tmux Manager")
@@ -10,6 +23,27 @@ mcp = FastMCP("Tmux Manager")
 MCP_SESSION_NAME = "mcptools-session"
 CREATED_SESSION = False
 
+# Control mode: keep one `tmux -C` client alive instead of spawning a process per command.
+# Set MCP_TMUX_CONTROL_MODE=0 to always use the subprocess path.
+CONTROL_MODE_ENABLED = os.environ.get("MCP_TMUX_CONTROL_MODE", "1") != "0"
+# Seconds to wait for a reply on the control connection.
+COMMAND_TIMEOUT = float(os.environ.get("MCP_TMUX_COMMAND_TIMEOUT", "30"))
+# Seconds to wait before trying to reconnect after the control client failed to start.
+CONTROL_RETRY_DELAY = 30.0
+# Seconds to trust the cached session state before checking with tmux again.
+SESSION_CACHE_TTL = float(os.environ.get("MCP_TMUX_SESSION_CACHE_TTL", "30"))
+# Maximum number of tool calls running tmux commands at the same time.
+MAX_CONCURRENCY = int(os.environ.get("MCP_TMUX_MAX_CONCURRENCY", "8"))
+
+# Idle shell windows kept ready in MCP_SESSION_NAME for tmux_new_window (0 disables the pool).
+SHELL_POOL_SIZE = int(os.environ.get("MCP_TMUX_SHELL_POOL_SIZE", "0"))
+# Seconds an idle pooled shell may wait before it is replaced with a fresh one (0 keeps it forever).
+SHELL_POOL_TTL = float(os.environ.get("MCP_TMUX_SHELL_POOL_TTL", "600"))
+# Which idle shell is used first: "fifo" (oldest) or "lifo" (newest, letting surplus shells expire).
+SHELL_POOL_EVICTION = os.environ.get("MCP_TMUX_SHELL_POOL_EVICTION", "fifo").lower()
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="tmux-tool")
+
 def is_in_tmux() -> bool:
     """Checks if we are running inside a tmux session."""
     return os.environ.get("TMUX") is not None
@@ -17,6 +51,10 @@ def is_in_tmux() -> bool:
 def cleanup_session():
     """Cleanup the tmux session if we created it."""
     global CREATED_SESSION
+    shell_pool.close()
+    close_control_client()
+    session_cache.invalidate()
+    remove_job_directory()
     if CREATED_SESSION:
         try:
             subprocess.run(
@@ -29,9 +67,81 @@ def cleanup_session():
 
 atexit.register(cleanup_session)
 
+# Errors after which the cached session state can no longer be trusted.
+STALE_STATE_ERRORS = ("can't find session", "session not found", "can't find window", "can't find pane", "no server running")
+# Errors meaning the session itself is gone.
+MISSING_SESSION_ERRORS = ("can't find session", "session not found", "no server running")
+# Commands that change the window/pane layout.
+TOPOLOGY_COMMANDS = frozenset({
+    "new-window", "kill-window", "rename-window", "move-window", "swap-window", "link-window", "unlink-window",
+    "split-window", "kill-pane", "break-pane", "join-pane", "move-pane", "swap-pane", "kill-session",
+})
+TOPOLOGY_FIELDS = (
+    ("session_name", str), ("pane_id", str), ("window_id", str), ("window_index", int),
+    ("window_name", str), ("pane_index", int),
+)
+
+
+class SessionStateCache:
+    """
+    Remembers that the session exists and what its windows and panes are, so that
+    tool calls do not have to ask tmux every time. Entries expire after SESSION_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._session_checked_at = None
+        self._topology = None
+        self._topology_at = None
+
+    def _fresh(self, timestamp) -> bool:
+        return timestamp is not None and time.monotonic() - timestamp < SESSION_CACHE_TTL
+
+    def session_known(self) -> bool:
+        with self._lock:
+            return self._fresh(self._session_checked_at)
+
+    def mark_session_exists(self):
+        with self._lock:
+            self._session_checked_at = time.monotonic()
+
+    def topology(self) -> list[dict]:
+        with self._lock:
+            return self._topology if self._fresh(self._topology_at) else None
+
+    def set_topology(self, panes: list[dict]):
+        with self._lock:
+            self._topology = panes
+            self._topology_at = time.monotonic()
+
+    def invalidate_topology(self):
+        with self._lock:
+            self._topology = None
+            self._topology_at = None
+
+    def invalidate(self):
+        with self._lock:
+            self._session_checked_at = None
+            self._topology = None
+            self._topology_at = None
+
+    def observe(self, args: list[str], success: bool, output: str):
+        """Updates the cache from the outcome of a tmux command."""
+        if not success and any(error in output for error in STALE_STATE_ERRORS):
+            self.invalidate()
+        elif args and args[0] in TOPOLOGY_COMMANDS:
+            self.invalidate_topology()
+
+
+session_cache = SessionStateCache()
+
+
 def ensure_session():
     """Ensure the MCP tmux session exists if we are not in tmux."""
     global CREATED_SESSION
+
+    if session_cache.session_known():
+        return
     
     # Check if session exists
     check = subprocess.run(
@@ -50,7 +160,8 @@ def ensure_session():
             CREATED_SESSION = True
         except subprocess.CalledProcessError as e:
             # It might have been created concurrently or failed
-            pass
+            return
+    session_cache.mark_session_exists()
 
 def resolve_target(target: str = None) -> str:
     """
@@ -67,7 +178,8 @@ def resolve_target(target: str = None) -> str:
     
     if target:
         # If user explicitly gave a target
-        if ":" in target:
+        # (pane, window and session ids such as %3 are unique across sessions)
+        if ":" in target or target.startswith(("%", "@", "$")):
             return target
         # Prepend session name
         return f"{MCP_SESSION_NAME}:{target}"
@@ -77,45 +189,1146 @@ def resolve_target(target: str = None) -> str:
         # (though some commands accept session object, others need window/pane)
         return f"{MCP_SESSION_NAME}:"
 
+class ControlModeUnavailable(Exception):
+    """Raised when a command was not delivered over the control connection."""
+
+
+def quote_tmux_argument(arg: str) -> str:
+    """Quotes a single argument for tmux's command parser (used on the control connection)."""
+    escaped = arg.replace("\\", "\\\\")
+    for char, replacement in (('"', '\\"'), ("$", "\\$"), ("~", "\\~"), ("\n", "\\n"), ("\r", "\\r")):
+        escaped = escaped.replace(char, replacement)
+    return f'"{escaped}"'
+
+
+class _PendingCommand:
+    """A command written to the control client that is waiting for its reply block."""
+
+    def __init__(self):
+        self.future = Future()
+        self.started = False
+
+
+class TmuxControlClient:
+    """
+    A long-lived tmux control mode (`tmux -C`) client.
+
+    Commands are written to its stdin, one per line. tmux answers each of them, in order,
+    with a %begin ... %end (or %error) block on stdout; notifications outside blocks are ignored.
+    """
+
+    def __init__(self, session: str):
+        self.session = session
+        self.process = None
+        self.established = False
+        self._reader_done = False
+        self._lock = threading.Lock()
+        self._pending = collections.deque()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            ["tmux", "-C", "attach-session", "-f", "ignore-size,no-output", "-t", self.session],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        reader = threading.Thread(target=self._read_loop, name="tmux-control-reader", daemon=True)
+        reader.start()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and not self._reader_done and self.process.poll() is None
+
+    def submit(self, commands: list[list[str]]) -> list[Future]:
+        """
+        Writes commands to the control client without waiting for their replies.
+        Each future resolves to (success, output).
+        Raises ControlModeUnavailable if nothing could be written.
+        """
+        pending = [_PendingCommand() for _ in commands]
+        payload = "".join(" ".join(quote_tmux_argument(arg) for arg in args) + "\n" for args in commands)
+        with self._lock:
+            if not self.is_alive():
+                raise ControlModeUnavailable("control client is not running")
+            self._pending.extend(pending)
+            try:
+                self.process.stdin.write(payload)
+                self.process.stdin.flush()
+            except (OSError, ValueError) as e:
+                for item in pending:
+                    self._pending.remove(item)
+                raise ControlModeUnavailable(str(e))
+        return [item.future for item in pending]
+
+    def command(self, args: list[str], timeout: float = None) -> tuple[bool, str]:
+        """Runs a single command and waits for its reply."""
+        future = self.submit([args])[0]
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # The reply stream can no longer be trusted; drop the connection.
+            self.close()
+            return False, f"timed out after {timeout}s waiting for tmux"
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+    def _read_loop(self):
+        block = None
+        lines = []
+        for raw in self.process.stdout:
+            line = raw.rstrip("\n")
+            if block is None:
+                if line.startswith("%begin "):
+                    block = line.split(" ")[1:4]
+                    lines = []
+                    if self._is_own(block):
+                        with self._lock:
+                            if self._pending:
+                                self._pending[0].started = True
+                elif line.startswith("%exit"):
+                    break
+                continue
+
+            parts = line.split(" ")
+            # Match time and command number too, so pane content that looks like a guard line is kept.
+            if parts[0] in ("%end", "%error") and parts[1:3] == block[:2]:
+                if self._is_own(block):
+                    with self._lock:
+                        item = self._pending.popleft() if self._pending else None
+                    self.established = True
+                    if item is not None:
+                        output = "".join(f"{text}\n" for text in lines)
+                        item.future.set_result((parts[0] == "%end", output))
+                block = None
+            else:
+                lines.append(line)
+
+        self.process.stdout.close()
+        with self._lock:
+            self._reader_done = True
+            while self._pending:
+                item = self._pending.popleft()
+                if item.started:
+                    item.future.set_result((False, "control connection lost"))
+                else:
+                    item.future.set_exception(ControlModeUnavailable("control client exited"))
+
+    @staticmethod
+    def _is_own(block: list[str]) -> bool:
+        # The flags field is 1 for commands sent by this client.
+        return len(block) < 3 or block[2] == "1"
+
+
+_control_client = None
+_control_lock = threading.Lock()
+_control_retry_at = 0.0
+
+
+def current_session_target() -> str:
+    """The session tools operate on by default (used to attach the control client), or None if unknown."""
+    if not is_in_tmux():
+        return MCP_SESSION_NAME
+    pane = os.environ.get("TMUX_PANE")
+    if pane:
+        return pane
+    # TMUX is "socket,pid,session_id"
+    parts = os.environ["TMUX"].split(",")
+    if len(parts) >= 3 and parts[-1].isdigit():
+        return f"${parts[-1]}"
+    return None
+
+
+def get_control_client() -> TmuxControlClient:
+    """Returns a running control client, (re)connecting if needed, or None if control mode is unavailable."""
+    global _control_client
+    if not CONTROL_MODE_ENABLED or time.monotonic() < _control_retry_at:
+        return None
+    session = current_session_target()
+    if session is None:
+        return None
+
+    with _control_lock:
+        client = _control_client
+        if client is not None and client.is_alive() and client.session == session:
+            return client
+        if client is not None:
+            client.close()
+        _control_client = None
+        try:
+            client = TmuxControlClient(session)
+            client.start()
+        except OSError:
+            mark_control_failed()
+            return None
+        _control_client = client
+        return client
+
+
+def mark_control_failed():
+    """Backs off from control mode for a while after the client failed to start or exited early."""
+    global _control_retry_at
+    _control_retry_at = time.monotonic() + CONTROL_RETRY_DELAY
+
+
+def clear_control_backoff():
+    """Allows the control client to reconnect right away."""
+    global _control_retry_at
+    _control_retry_at = 0.0
+
+
+def close_control_client():
+    """Closes the control client, if any."""
+    global _control_client
+    with _control_lock:
+        if _control_client is not None:
+            _control_client.close()
+        _control_client = None
+    clear_control_backoff()
+
+
+def run_control_command(args: list[str]) -> tuple[bool, str]:
+    """
+    Runs a command over the control connection.
+    Returns (success, output), or None if the command was not delivered and should use a subprocess instead.
+    """
+    for _ in range(2):
+        client = get_control_client()
+        if client is None:
+            return None
+        try:
+            return client.command(args, timeout=COMMAND_TIMEOUT)
+        except ControlModeUnavailable:
+            # An established connection may just have lost its session; reconnect once.
+            # A client that never answered is unlikely to work next time either.
+            if not client.established:
+                mark_control_failed()
+                return None
+    return None
+
+
+def escape_command_line_argument(arg: str) -> str:
+    """On the command line tmux treats a trailing ';' as a command separator unless it is escaped."""
+    return arg[:-1] + "\\;" if arg.endswith(";") else arg
+
+
+def execute_tmux(args: list[str]) -> tuple[bool, str]:
+    """
+    Runs a tmux command over the control connection, or as a subprocess if that is not possible.
+    Returns (success, raw output or error message) and keeps the session cache up to date.
+    """
+    reply = None
+    # Inside tmux, commands without an explicit target depend on the calling client's
+    # context, which the control client does not share.
+    if not is_in_tmux() or "-t" in args:
+        reply = run_control_command(args)
+    if reply is None:
+        result = subprocess.run(
+            ["tmux"] + [escape_command_line_argument(arg) for arg in args],
+            capture_output=True,
+            text=True
+        )
+        reply = (True, result.stdout) if result.returncode == 0 else (False, result.stderr)
+
+    session_cache.observe(args, *reply)
+    return reply
+
+
 def run_tmux_command(args: list[str]) -> str:
     """
     Executes a tmux command.
     Automatically handles session creation if outside tmux.
+    Uses the persistent control mode client when possible, falling back to a tmux subprocess.
     """
     if not is_in_tmux():
         ensure_session()
-    
+
     try:
-        result = subprocess.run(
-            ["tmux"] + args,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        return f"Tmux Error: {e.stderr.strip()}"
+        success, output = execute_tmux(args)
+        if not success and not is_in_tmux() and any(error in output for error in MISSING_SESSION_ERRORS):
+            # The cached session state was stale; recreate the session and try once more.
+            # The control client most likely failed for the same reason, so let it reconnect.
+            clear_control_backoff()
+            ensure_session()
+            success, output = execute_tmux(args)
     except Exception as e:
         return f"Error: {e}"
 
+    if success:
+        return output.strip()
+    return f"Tmux Error: {output.strip()}"
+
+
+def execute_tmux_chain(commands: list[list[str]]) -> list[tuple[bool, str]]:
+    """
+    Runs commands in a single tmux process, chained with ';'. tmux stops at the first failing command.
+    A marker is printed after each command so output and failures can be attributed to it.
+    Returns (success, output) per command, or None for commands that did not run.
+    """
+    marker = f"mcptools-batch-{uuid.uuid4().hex}"
+    argv = ["tmux"]
+    for args in commands:
+        argv.extend(escape_command_line_argument(arg) for arg in args)
+        argv.extend([";", "display-message", "-p", marker, ";"])
+    argv.pop()
+
+    result = subprocess.run(argv, capture_output=True, text=True)
+    outputs = result.stdout.split(f"{marker}\n")
+    completed = len(outputs) - 1
+
+    replies = []
+    for index, args in enumerate(commands):
+        if index < completed:
+            reply = (True, outputs[index])
+        elif index == completed and result.returncode != 0:
+            reply = (False, result.stderr)
+        else:
+            reply = None
+        if reply is not None:
+            session_cache.observe(args, *reply)
+        replies.append(reply)
+    return replies
+
+
+def execute_tmux_batch(commands: list[list[str]], stop_on_error: bool = True) -> list[tuple[bool, str]]:
+    """
+    Runs several commands with as little overhead as possible: over the control connection
+    (pipelined unless stop_on_error), or otherwise chained in one tmux process.
+    Returns (success, output) per command, or None for commands skipped after a failure.
+    """
+    if not is_in_tmux():
+        ensure_session()
+
+    client = None
+    if not is_in_tmux() or all("-t" in args for args in commands):
+        client = get_control_client()
+    if client is None:
+        replies = execute_tmux_chain(commands)
+        if not stop_on_error:
+            # Chaining stops at the first failure; run what is left on its own.
+            for index, reply in enumerate(replies):
+                if reply is None:
+                    replies[index] = execute_tmux(commands[index])
+        return replies
+
+    if stop_on_error:
+        replies = []
+        failed = False
+        for args in commands:
+            reply = None if failed else execute_tmux(args)
+            failed = failed or not reply[0]
+            replies.append(reply)
+        return replies
+
+    try:
+        futures = client.submit(commands)
+    except ControlModeUnavailable:
+        return [execute_tmux(args) for args in commands]
+    replies = []
+    for args, future in zip(commands, futures):
+        try:
+            reply = future.result(timeout=COMMAND_TIMEOUT)
+            session_cache.observe(args, *reply)
+        except ControlModeUnavailable:
+            reply = execute_tmux(args)
+        replies.append(reply)
+    return replies
+
+
+def list_pane_topology(scope: list[str]) -> list[dict]:
+    """Lists panes (TOPOLOGY_FIELDS) with list-panes and the given scope arguments, e.g. ["-a"]."""
+    if not is_in_tmux():
+        ensure_session()
+    success, output = execute_tmux(["list-panes"] + scope + ["-F", list_format(TOPOLOGY_FIELDS)])
+    if not success:
+        raise RuntimeError(f"Tmux Error: {output.strip()}")
+    return parse_listing(output, TOPOLOGY_FIELDS)
+
+
+def list_session_panes() -> list[dict]:
+    """
+    Lists the panes of the current session (TOPOLOGY_FIELDS) live, and refreshes the cached topology.
+    The cache only notices layout changes made through this server, so use this where missing a pane matters.
+    """
+    scope = ["-s"]
+    session = current_session_target()
+    if session:
+        scope.extend(["-t", session])
+    panes = list_pane_topology(scope)
+    session_cache.set_topology(panes)
+    return panes
+
+
+def get_topology() -> list[dict]:
+    """
+    Returns the panes of the current session (TOPOLOGY_FIELDS), from the cache when it is fresh.
+    """
+    panes = session_cache.topology()
+    if panes is not None:
+        return panes
+    return list_session_panes()
+
+
+# Number of trailing lines remembered per pane to recognise where the previous delta capture ended.
+CURSOR_ANCHOR_LINES = 3
+
+# pane_id -> {"row": absolute row of the cursor line, "anchor": lines just above it}
+_pane_cursors = {}
+_pane_cursors_lock = threading.Lock()
+
+
+def split_lines(output: str) -> list[str]:
+    """Splits raw command output into lines, keeping empty lines but not the final newline."""
+    lines = output.split("\n")
+    if lines and lines[-1] == "":
+        lines.pop()
+    return lines
+
+
+def capture_rows(target: str, history_size: int, start: str, end: int) -> list[str]:
+    """
+    Captures pane rows. Rows count from the top of the scrollback, so tmux line numbers are row - history_size.
+    start may also be "-" for the start of the history. Raises RuntimeError on tmux errors.
+    """
+    args = ["capture-pane", "-p"]
+    if target:
+        args.extend(["-t", target])
+    if start != "-":
+        start = str(start - history_size)
+    args.extend(["-S", start, "-E", str(end - history_size)])
+    success, output = execute_tmux(args)
+    if not success:
+        raise RuntimeError(f"Tmux Error: {output.strip()}")
+    return split_lines(output)
+
+
+def capture_pane_delta(target: str, since: str) -> str:
+    """
+    Returns the lines completed in a pane since the cursor `since`, preceded by a new cursor.
+
+    Cursors look like "%3:1042" (pane id and absolute row of the cursor line); "0" starts from the top of
+    the scrollback. Positions come from history_size and cursor_y. The last few lines before the cursor
+    are remembered, so that a cleared or wrapped history is detected and reported as a reset.
+    """
+    args = ["display-message", "-p"]
+    if target:
+        args.extend(["-t", target])
+    args.append("#{pane_id} #{history_size} #{cursor_y}")
+    success, output = execute_tmux(args)
+    if not success:
+        return f"Tmux Error: {output.strip()}"
+    pane_id, history_size, cursor_y = output.split()
+    history_size, cursor_y = int(history_size), int(cursor_y)
+    row = history_size + cursor_y
+
+    if since == "0":
+        previous_row = 0
+    else:
+        cursor_pane, _, cursor_row = since.rpartition(":")
+        if not cursor_row.isdigit():
+            return f"Error: Invalid cursor '{since}'. Use a cursor returned by a previous capture, or '0'."
+        if cursor_pane != pane_id:
+            return f"Error: Cursor '{since}' belongs to pane {cursor_pane}, not {pane_id}."
+        previous_row = int(cursor_row)
+
+    with _pane_cursors_lock:
+        state = _pane_cursors.get(pane_id)
+    anchor = state["anchor"] if state and state["row"] == previous_row else []
+
+    reset = False
+    if previous_row > row:
+        # The pane was cleared
+        reset = True
+        lines = capture_rows(target, history_size, "-", row - 1) if row > 0 else []
+        seen = []
+    else:
+        start = max(previous_row - len(anchor), 0)
+        lines = capture_rows(target, history_size, start, row - 1) if start < row else []
+        seen = lines[:previous_row - start]
+        lines = lines[previous_row - start:]
+        if seen != anchor:
+            # Lines scrolled off the top of a full history, or it was cleared: find where we stopped.
+            everything = capture_rows(target, history_size, "-", row - 1) if row > 0 else []
+            seen = []
+            reset = True
+            lines = everything
+            for i in range(len(everything) - len(anchor), -1, -1):
+                if everything[i:i + len(anchor)] == anchor:
+                    seen = anchor
+                    lines = everything[i + len(anchor):]
+                    reset = False
+                    break
+
+    with _pane_cursors_lock:
+        _pane_cursors[pane_id] = {"row": row, "anchor": (seen + lines)[-CURSOR_ANCHOR_LINES:]}
+
+    header = f"[cursor {pane_id}:{row}{' reset' if reset else ''}]"
+    return "\n".join([header] + lines)
+
+
+# Seconds between captures when waiting on a pane that already has a pipe of its own.
+WAIT_POLL_INTERVAL = 0.5
+# Seconds of silence after which an unterminated line (such as a prompt) is matched.
+PARTIAL_LINE_DELAY = 0.2
+
+ANSI_ESCAPE_RE = re.compile(r"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])")
+
+
+def clean_terminal_line(line: str) -> str:
+    """Removes escape sequences and carriage-return overwrites from a line of raw terminal output."""
+    line = ANSI_ESCAPE_RE.sub("", line).rstrip("\r")
+    return line.rsplit("\r", 1)[-1]
+
+
+class PaneOutputPipe:
+    """
+    Streams a pane's output into a FIFO with pipe-pane for the duration of a `with` block,
+    so new output can be read without capturing the pane repeatedly.
+    """
+
+    def __init__(self, target: str):
+        self.target = target
+        self.directory = None
+        self.fd = None
+        self.keepalive_fd = None
+
+    def __enter__(self):
+        self.directory = tempfile.mkdtemp(prefix="mcptools-pipe-")
+        path = os.path.join(self.directory, "output")
+        try:
+            os.mkfifo(path)
+            self.fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+            # Hold a writer open so reads wait in select() instead of hitting EOF before cat starts.
+            self.keepalive_fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+            success, output = execute_tmux(["pipe-pane", "-O", "-o", "-t", self.target, f"cat > {shlex.quote(path)}"])
+            if not success:
+                raise RuntimeError(f"Tmux Error: {output.strip()}")
+        except BaseException:
+            self._close_files()
+            raise
+        return self
+
+    def read(self, timeout: float) -> bytes:
+        """Returns the next chunk of output, or b"" if none arrived within timeout seconds."""
+        ready, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not ready:
+            return b""
+        try:
+            return os.read(self.fd, 65536)
+        except BlockingIOError:
+            return b""
+
+    def __exit__(self, *exc):
+        execute_tmux(["pipe-pane", "-t", self.target])
+        self._close_files()
+
+    def _close_files(self):
+        for fd in (self.fd, self.keepalive_fd):
+            if fd is not None:
+                os.close(fd)
+        self.fd = self.keepalive_fd = None
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def format_wait_result(pattern: str, pane_id: str, elapsed: float, context: list[str], matched: bool) -> str:
+    if matched:
+        return f"Matched '{pattern}' in pane {pane_id} after {elapsed:.1f}s:\n" + "\n".join(context)
+    result = f"Timeout: '{pattern}' did not appear in pane {pane_id} within {elapsed:.1f}s."
+    if context:
+        result += "\nLast output:\n" + "\n".join(context)
+    return result
+
+
+def wait_for_output(target: str, pattern: str, timeout: float, context_lines: int) -> str:
+    """
+    Blocks until a line of new pane output matches pattern, or timeout seconds pass.
+    Output is read from pipe-pane; if the pane already has a pipe, it is polled with delta captures instead.
+    """
+    try:
+        regex = re.compile(pattern)
+    except re.error as e:
+        return f"Error: Invalid pattern '{pattern}': {e}"
+
+    args = ["display-message", "-p"]
+    if target:
+        args.extend(["-t", target])
+    args.append("#{pane_id} #{pane_pipe}")
+    success, output = execute_tmux(args)
+    if not success:
+        return f"Tmux Error: {output.strip()}"
+    pane_id, pane_pipe = output.split()
+
+    start = time.monotonic()
+    deadline = start + timeout
+    recent = collections.deque(maxlen=context_lines + 1)
+
+    def check(line: str) -> bool:
+        recent.append(line)
+        return regex.search(line) is not None
+
+    if pane_pipe == "1":
+        cursor = capture_pane_delta(pane_id, "0").split("\n", 1)[0].split()[1].rstrip("]")
+        while time.monotonic() < deadline:
+            time.sleep(min(WAIT_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+            header, *lines = capture_pane_delta(pane_id, cursor).split("\n")
+            cursor = header.split()[1].rstrip("]")
+            for line in lines:
+                if check(line):
+                    return format_wait_result(pattern, pane_id, time.monotonic() - start, list(recent), True)
+        return format_wait_result(pattern, pane_id, time.monotonic() - start, list(recent), False)
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    partial = ""
+    with PaneOutputPipe(pane_id) as pipe:
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            chunk = pipe.read(min(remaining, PARTIAL_LINE_DELAY) if partial else remaining)
+            if not chunk:
+                # Output went quiet on an unterminated line, such as a prompt: match it as it is.
+                current = clean_terminal_line(partial)
+                if current and regex.search(current):
+                    recent.append(current)
+                    return format_wait_result(pattern, pane_id, time.monotonic() - start, list(recent), True)
+                continue
+            *lines, partial = (partial + decoder.decode(chunk)).split("\n")
+            for line in lines:
+                if check(clean_terminal_line(line)):
+                    return format_wait_result(pattern, pane_id, time.monotonic() - start, list(recent), True)
+
+    if partial:
+        recent.append(clean_terminal_line(partial))
+    return format_wait_result(pattern, pane_id, time.monotonic() - start, list(recent), False)
+
+
+# Jobs started with exit status tracking: job_id -> {"command", "pane_id", "channel", "status_path", "started"}
+_jobs = {}
+_job_directory = None
+_jobs_lock = threading.Lock()
+
+
+def get_job_directory() -> str:
+    """Directory holding the exit status files of tracked jobs, created on first use."""
+    global _job_directory
+    with _jobs_lock:
+        if _job_directory is None:
+            _job_directory = tempfile.mkdtemp(prefix="mcptools-jobs-")
+        return _job_directory
+
+
+def remove_job_directory():
+    global _job_directory
+    with _jobs_lock:
+        if _job_directory is not None:
+            shutil.rmtree(_job_directory, ignore_errors=True)
+        _job_directory = None
+        _jobs.clear()
+
+
+def wrap_tracked_command(command: str, status_path: str, channel: str) -> str:
+    """
+    Wraps a command so that, when it finishes, its exit code is written to status_path
+    and the tmux wait-for channel is signalled. The command itself runs in the user's shell.
+    """
+    status = shlex.quote(status_path)
+    script = (
+        f'"${{SHELL:-sh}}" -c {shlex.quote(command)}; '
+        f'echo $? > {status}.tmp && mv {status}.tmp {status}; '
+        f'tmux wait-for -S {channel}'
+    )
+    return f"sh -c {shlex.quote(script)}"
+
+
+def pane_tail(pane_id: str, lines: int) -> list[str]:
+    """The last non-empty lines of a pane, without the keep_open trailer; empty if the pane is gone."""
+    success, output = execute_tmux(["capture-pane", "-p", "-t", pane_id, "-S", str(-lines)])
+    if not success:
+        return []
+    captured = split_lines(output)
+    while captured and not captured[-1].strip():
+        captured.pop()
+    if captured and captured[-1] == KEEP_OPEN_PROMPT:
+        captured = captured[:-1]
+        while captured and (not captured[-1].strip() or captured[-1] == KEEP_OPEN_SEPARATOR):
+            captured.pop()
+    return captured[-lines:]
+
+
+def forget_job(job_id: str):
+    """Drops a finished job and its exit status file."""
+    with _jobs_lock:
+        job = _jobs.pop(job_id, None)
+    if job is not None:
+        try:
+            os.remove(job["status_path"])
+        except FileNotFoundError:
+            pass
+
+
+def wait_for_job(job_id: str, timeout: float, tail_lines: int) -> str:
+    """
+    Waits up to timeout seconds for a tracked job and reports its exit code, runtime and output tail.
+    A job is forgotten once its end has been reported.
+    """
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None:
+        return f"Error: Unknown job '{job_id}'."
+
+    if not os.path.exists(job["status_path"]) and timeout > 0:
+        try:
+            subprocess.run(["tmux", "wait-for", job["channel"]], capture_output=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            pass
+
+    if not os.path.exists(job["status_path"]):
+        elapsed = time.time() - job["started"]
+        success, _ = execute_tmux(["display-message", "-p", "-t", job["pane_id"], "#{pane_id}"])
+        if not success:
+            forget_job(job_id)
+            return f"Job {job_id} ended without reporting an exit code (its window was closed): {job['command']}"
+        return f"Job {job_id} is still running after {elapsed:.1f}s: {job['command']}"
+
+    with open(job["status_path"]) as f:
+        exit_code = f.read().strip()
+    runtime = os.stat(job["status_path"]).st_mtime - job["started"]
+    forget_job(job_id)
+    result = f"Job {job_id} exited with code {exit_code} after {runtime:.1f}s: {job['command']}"
+    if tail_lines > 0:
+        tail = pane_tail(job["pane_id"], tail_lines)
+        if tail:
+            result += "\nLast output:\n" + "\n".join(tail)
+    return result
+
+
+def compact_lines(lines: list[str], strip_ansi: bool = False) -> list[str]:
+    """
+    Shrinks captured output: strips trailing whitespace (and escape sequences if asked),
+    collapses runs of identical lines such as progress bars into one line marked "×N",
+    and drops trailing blank lines.
+    """
+    compacted = []
+    previous, count = None, 0
+    for line in lines + [None]:
+        if line is not None:
+            if strip_ansi:
+                line = ANSI_ESCAPE_RE.sub("", line)
+            line = line.rstrip()
+            if line == previous:
+                count += 1
+                continue
+        if previous is not None:
+            compacted.append(f"{previous} ×{count}" if count > 1 and previous else previous)
+        previous, count = line, 1
+    while compacted and not compacted[-1]:
+        compacted.pop()
+    return compacted
+
+
+def keep_last_lines(lines: list[str], max_lines: int = None, max_bytes: int = None) -> list[str]:
+    """Returns the last lines that fit in max_lines and in max_bytes once joined with newlines."""
+    kept = []
+    size = 0
+    for line in reversed(lines):
+        if max_lines is not None and len(kept) >= max_lines:
+            break
+        line_size = len(line.encode("utf-8")) + 1
+        if max_bytes is not None and size + line_size > max_bytes:
+            if not kept and max_bytes > 0:
+                # Even the last line is too long: keep its end.
+                kept.append(line.encode("utf-8")[-max_bytes:].decode("utf-8", errors="ignore"))
+            break
+        kept.append(line)
+        size += line_size
+    kept.reverse()
+    return kept
+
+
+def apply_budget(lines: list[str], max_lines: int = None, max_bytes: int = None) -> list[str]:
+    """
+    Keeps the last lines that fit in max_lines and max_bytes, noting how many earlier lines were dropped.
+    The note counts against both limits, and is left out when there is no room for it and a line.
+    """
+    kept = keep_last_lines(lines, max_lines, max_bytes)
+    if kept == lines:
+        return kept
+    # Room is reserved for the longest note, which has the largest possible count.
+    note_size = len(f"[... {len(lines)} earlier lines omitted ...]".encode("utf-8")) + 1
+    room_lines = None if max_lines is None else max_lines - 1
+    room_bytes = None if max_bytes is None else max_bytes - note_size
+    if (room_lines is not None and room_lines < 1) or (room_bytes is not None and room_bytes < 1):
+        return kept
+    kept = keep_last_lines(lines, room_lines, room_bytes)
+    return [f"[... {len(lines) - len(kept)} earlier lines omitted ...]"] + kept
+
+
+# Bytes read from tmux at a time when a capture is written to a file.
+CAPTURE_CHUNK_SIZE = 64 * 1024
+# Lines of a capture written to a file that are included in the response.
+CAPTURE_TAIL_LINES = 10
+# Bytes kept from the end of a capture written to a file, to take those lines from.
+CAPTURE_TAIL_BYTES = 16 * 1024
+
+
+def capture_to_file(args: list[str], output_path: str, tail_lines: int = CAPTURE_TAIL_LINES) -> str:
+    """
+    Runs a capture-pane command as a subprocess and streams its output into output_path
+    chunk by chunk, so a long history is never held in memory as a whole.
+    Returns the path, size and line count with the last tail_lines lines.
+    """
+    if not is_in_tmux():
+        ensure_session()
+    path = os.path.abspath(os.path.expanduser(output_path))
+    size = lines = 0
+    # Only the end of the output is kept, for the tail.
+    tail = b""
+    process = subprocess.Popen(
+        ["tmux"] + [escape_command_line_argument(arg) for arg in args],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    try:
+        with open(path, "wb") as out_file:
+            while chunk := process.stdout.read(CAPTURE_CHUNK_SIZE):
+                out_file.write(chunk)
+                size += len(chunk)
+                lines += chunk.count(b"\n")
+                tail = (tail + chunk)[-CAPTURE_TAIL_BYTES:]
+        error = process.stderr.read().decode("utf-8", errors="replace")
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+        process.wait()
+
+    session_cache.observe(args, process.returncode == 0, error)
+    if process.returncode != 0:
+        os.remove(path)
+        return f"Tmux Error: {error.strip()}"
+    if tail and not tail.endswith(b"\n"):
+        lines += 1
+    last = tail.decode("utf-8", errors="replace").rstrip("\n").split("\n")[-tail_lines:] if tail_lines > 0 and tail else []
+    summary = f"Captured {lines} lines ({size} bytes) to {path}"
+    return "\n".join([summary, f"Last {len(last)} lines:"] + last) if last else summary
+
+
+# Panes captured per round when searching, so the search can stop once it has enough matches.
+SEARCH_CHUNK_SIZE = 32
+
+
+def search_panes(regex: re.Pattern, panes: list[dict], history: bool, max_results: int, context_lines: int) -> dict:
+    """
+    Captures panes in pipelined chunks and scans them with regex, stopping once max_results matches are found.
+    Line numbers count from the top of the captured text (the oldest history line with history=True).
+    """
+    matches = []
+    searched = 0
+    for chunk_start in range(0, len(panes), SEARCH_CHUNK_SIZE):
+        chunk = panes[chunk_start:chunk_start + SEARCH_CHUNK_SIZE]
+        commands = []
+        for pane in chunk:
+            args = ["capture-pane", "-p", "-J", "-t", pane["pane_id"]]
+            if history:
+                args.extend(["-S", "-"])
+            commands.append(args)
+
+        for pane, reply in zip(chunk, execute_tmux_batch(commands, stop_on_error=False)):
+            searched += 1
+            if reply is None or not reply[0]:
+                continue
+            lines = split_lines(reply[1])
+            for number, line in enumerate(lines):
+                if not regex.search(line):
+                    continue
+                matches.append({
+                    "pane_id": pane["pane_id"],
+                    "session_name": pane["session_name"],
+                    "window_index": pane["window_index"],
+                    "window_name": pane["window_name"],
+                    "line": number,
+                    "text": line,
+                    "context": lines[max(number - context_lines, 0):number + context_lines + 1],
+                })
+                if len(matches) >= max_results:
+                    return {"matches": matches, "panes_searched": searched, "truncated": True}
+    return {"matches": matches, "panes_searched": searched, "truncated": False}
+
+
+# Fields reported by tmux_list_windows and tmux_list_panes, with their types.
+# Pane fields of a window describe its active pane.
+WINDOW_FIELDS = (
+    ("session_name", str), ("window_id", str), ("window_index", int), ("window_name", str),
+    ("window_active", bool), ("window_panes", int), ("window_activity", int),
+    ("pane_current_command", str), ("pane_pid", int), ("pane_width", int), ("pane_height", int),
+    ("history_size", int),
+)
+PANE_FIELDS = (
+    ("session_name", str), ("window_id", str), ("window_index", int), ("window_name", str),
+    ("pane_id", str), ("pane_index", int), ("pane_active", bool), ("window_active", bool),
+    ("pane_current_command", str), ("pane_current_path", str), ("pane_pid", int),
+    ("pane_width", int), ("pane_height", int), ("history_size", int),
+)
+
+
+def list_format(fields) -> str:
+    return "\t".join(f"#{{{name}}}" for name, _ in fields)
+
+
+def parse_listing(output: str, fields) -> list[dict]:
+    """Parses the tab separated output of a list command run with list_format(fields)."""
+    items = []
+    for line in output.splitlines():
+        values = line.split("\t")
+        values += [""] * (len(fields) - len(values))
+        item = {}
+        for (name, kind), value in zip(fields, values):
+            if kind is bool:
+                item[name] = value == "1"
+            elif kind is int:
+                item[name] = int(value) if value.lstrip("-").isdigit() else None
+            else:
+                item[name] = value
+        items.append(item)
+    return items
+
+
+def filter_listing(items: list[dict], key: str, name: str = None, command: str = None, active: bool = None,
+                   limit: int = 100, offset: int = 0) -> str:
+    """
+    Filters items by window name and current command (substrings) and active flag,
+    then returns one page of them as JSON together with the total number of matches.
+    """
+    active_field = "pane_active" if key == "panes" else "window_active"
+    matches = [
+        item for item in items
+        if (name is None or name in item["window_name"])
+        and (command is None or command in item["pane_current_command"])
+        and (active is None or item[active_field] == active)
+    ]
+    page = matches[offset:offset + limit] if limit is not None else matches[offset:]
+    return json.dumps({"total": len(matches), "offset": offset, "limit": limit, key: page}, indent=2)
+
+
+def offload(func):
+    """
+    Turns a blocking tool function into a coroutine that runs it on the tool executor,
+    so a slow tmux command does not hold up other requests to the server.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    return wrapper
+
 @mcp.tool()
-def tmux_list_windows() -> str:
+@offload
+def tmux_list_windows(name: str = None, command: str = None, active: bool = None, limit: int = 100, offset: int = 0) -> str:
     """
-    Lists all windows in the current tmux session.
-    Returns a formatted list of window IDs, names, and active commands.
+    Lists the windows in the current tmux session as JSON: ids, names, active flag, pane count,
+    and the current command, pid, size and history size of each window's active pane.
+    Optionally filters by window name or command (substring match) and active flag, and pages
+    the result with limit/offset; "total" is the number of matching windows.
     """
-    args = ["list-windows"]
+    args = ["list-windows", "-F", list_format(WINDOW_FIELDS)]
     target = resolve_target()
     if target:
         args.extend(["-t", target])
         
-    return run_tmux_command(args)
+    output = run_tmux_command(args)
+    if output.startswith(("Tmux Error", "Error")):
+        return output
+    return filter_listing(without_pool_windows(parse_listing(output, WINDOW_FIELDS)), "windows", name, command, active, limit, offset)
 
 @mcp.tool()
-def tmux_new_window(command: str, name: str = None, keep_open: bool = True) -> str:
+@offload
+def tmux_list_panes(target_window: str = None, name: str = None, command: str = None, active: bool = None,
+                    limit: int = 100, offset: int = 0) -> str:
     """
-    Opens a new tmux window and runs the specified command.
+    Lists panes as JSON: ids, window, active flag, current command and path, pid, size and history size.
+    Covers all sessions unless target_window is given. Filters and paging work as in tmux_list_windows.
+    """
+    args = ["list-panes", "-F", list_format(PANE_FIELDS)]
+    if target_window:
+        args.extend(["-t", resolve_target(target_window)])
+    else:
+        args.append("-a")
+
+    output = run_tmux_command(args)
+    if output.startswith(("Tmux Error", "Error")):
+        return output
+    return filter_listing(without_pool_windows(parse_listing(output, PANE_FIELDS)), "panes", name, command, active, limit, offset)
+
+KEEP_OPEN_SEPARATOR = "--------------------------------------------------"
+KEEP_OPEN_PROMPT = "Command finished. Press Enter to close window..."
+
+# Name of the idle windows in the shell pool.
+SHELL_POOL_WINDOW_NAME = "mcptools-pool"
+# Longest time the refill thread sleeps before checking for expired shells.
+SHELL_POOL_CHECK_INTERVAL = 30.0
+
+class ShellPool:
+    """
+    Idle, already initialised shell windows in MCP_SESSION_NAME.
+    tmux_new_window types its command into one of them instead of starting a new shell,
+    and a background thread replaces used and expired shells.
+    """
+
+    def __init__(self, size: int, ttl: float, eviction: str = "fifo"):
+        self.size = size
+        self.ttl = ttl
+        self.lifo = eviction == "lifo"
+        # (window_id, pane_id, created) of idle shells, oldest first
+        self._idle = collections.deque()
+        # expired shells taken out by acquire, killed by the refill thread
+        self._expired = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def enabled(self) -> bool:
+        # Inside tmux new windows go to the current session, so the pool is not used.
+        return self.size > 0 and not is_in_tmux()
+
+    def start(self):
+        """Starts the refill thread if the pool is enabled and not yet running."""
+        with self._lock:
+            if not self.enabled() or self._closed or (self._thread and self._thread.is_alive()):
+                return
+            self._thread = threading.Thread(target=self._run, name="tmux-shell-pool", daemon=True)
+            self._thread.start()
+
+    def acquire(self):
+        """Takes an idle shell as (window_id, pane_id), or returns None if none is ready."""
+        if not self.enabled():
+            return None
+        self.start()
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                shell = self._idle.pop() if self.lifo else self._idle.popleft()
+                if not self.ttl or now - shell[2] < self.ttl:
+                    break
+                self._expired.append(shell)
+            else:
+                shell = None
+        self._wake.set()
+        return shell[:2] if shell else None
+
+    def idle_count(self) -> int:
+        with self._lock:
+            return len(self._idle)
+
+    def window_ids(self) -> set[str]:
+        """Ids of the windows the pool still owns (idle or waiting to be killed)."""
+        with self._lock:
+            return {shell[0] for shell in self._idle} | {shell[0] for shell in self._expired}
+
+    def _run(self):
+        while not self._closed:
+            try:
+                self.evict_expired()
+                self.refill()
+            except Exception:
+                pass
+            interval = min(self.ttl, SHELL_POOL_CHECK_INTERVAL) if self.ttl else SHELL_POOL_CHECK_INTERVAL
+            self._wake.wait(interval)
+            self._wake.clear()
+
+    def evict_expired(self):
+        """Kills idle shells older than the TTL."""
+        now = time.time()
+        with self._lock:
+            expired = self._expired[:]
+            self._expired.clear()
+            if self.ttl:
+                expired += [shell for shell in self._idle if now - shell[2] >= self.ttl]
+                self._idle = collections.deque(shell for shell in self._idle if now - shell[2] < self.ttl)
+        for window_id, _, _ in expired:
+            run_tmux_command(["kill-window", "-t", window_id])
+
+    def refill(self):
+        """Starts shells until the pool is full."""
+        while not self._closed and self.idle_count() < self.size:
+            output = run_tmux_command([
+                "new-window", "-d", "-t", f"{MCP_SESSION_NAME}:", "-n", SHELL_POOL_WINDOW_NAME,
+                "-P", "-F", "#{window_id} #{pane_id}",
+            ])
+            if "Error" in output or len(output.split()) != 2:
+                return
+            window_id, pane_id = output.split()
+            with self._lock:
+                closed = self._closed
+                if not closed:
+                    self._idle.append((window_id, pane_id, time.time()))
+            if closed:
+                run_tmux_command(["kill-window", "-t", window_id])
+
+    def close(self):
+        """Stops the refill thread and kills the idle shells."""
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle) + self._expired
+            self._idle.clear()
+            self._expired.clear()
+        self._wake.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=COMMAND_TIMEOUT)
+        for window_id, _, _ in idle:
+            run_tmux_command(["kill-window", "-t", window_id])
+
+shell_pool = ShellPool(SHELL_POOL_SIZE, SHELL_POOL_TTL, SHELL_POOL_EVICTION)
+
+def without_pool_windows(items: list[dict]) -> list[dict]:
+    """
+    Drops windows and panes of idle pooled shells from a listing, so they are never listed,
+    searched or sent keys. Shells handed out by the pool are no longer idle and stay listed.
     """
+    pool_ids = shell_pool.window_ids()
+    return [item for item in items if item["window_id"] not in pool_ids]
+
+def run_in_pooled_shell(shell: tuple[str, str], command: str, name: str = None, keep_open: bool = True):
+    """
+    Types a command into a pooled shell and brings its window to the front.
+    Returns None if the shell is gone, so the caller can fall back to a new window.
+    """
+    window_id, pane_id = shell
+    # The shell stays at its prompt after the command, which keeps the window open.
+    line = command if keep_open else f"{command}; exit"
+    if name:
+        rename = [["rename-window", "-t", window_id, name]]
+    else:
+        # Named after the command straight away, as new-window would, so the window never shows
+        # up under the pool's name; automatic-rename then follows the running program.
+        words = command.split()
+        rename = [
+            ["rename-window", "-t", window_id, os.path.basename(words[0]) if words else "shell"],
+            ["set-option", "-w", "-t", window_id, "automatic-rename", "on"],
+        ]
+    results = execute_tmux_batch(rename + [
+        ["send-keys", "-t", pane_id, "-l", line],
+        ["send-keys", "-t", pane_id, "Enter"],
+        ["select-window", "-t", window_id],
+    ])
+    # select-window may fail harmlessly; renaming and typing the command must not.
+    if not all(reply and reply[0] for reply in results[:len(rename) + 2]):
+        return None
+    return pane_id
+
+# Argument builders shared by the individual tools and tmux_batch.
+
+def new_window_args(command: str, name: str = None, keep_open: bool = True) -> list[str]:
     args = ["new-window"]
     
     # Target resolution for new-window:
@@ -127,48 +1340,186 @@ def tmux_new_window(command: str, name: str = None, keep_open: bool = True) -> s
     if name:
         args.extend(["-n", name])
     
-    final_command = command
     if keep_open:
-        final_command = f'{command}; echo "\n--------------------------------------------------"; echo "Command finished. Press Enter to close window..."; read'
-    
-    args.append(final_command)
+        command = f'{command}; echo "\n{KEEP_OPEN_SEPARATOR}"; echo "{KEEP_OPEN_PROMPT}"; read'
     
-    output = run_tmux_command(args)
-    if "Error" in output:
-        return output
-    return f"Started command in new window{' ' + name if name else ''}: {command}"
+    args.append(command)
+    return args
 
-@mcp.tool()
-def tmux_rename_window(new_name: str, target_window: str = None) -> str:
-    """Renames a tmux window."""
+def rename_window_args(new_name: str, target_window: str = None) -> list[str]:
     args = ["rename-window"]
     real_target = resolve_target(target_window)
     if real_target:
         args.extend(["-t", real_target])
         
     args.append(new_name)
+    return args
+
+def send_keys_args(keys: str, target_pane: str = None) -> list[str]:
+    args = ["send-keys"]
+    real_target = resolve_target(target_pane)
+    if real_target:
+        args.extend(["-t", real_target])
     
-    output = run_tmux_command(args)
+    args.extend(shlex.split(keys))
+    return args
+
+def split_window_args(target_pane: str = None, direction: str = "vertical", command: str = None) -> list[str]:
+    args = ["split-window"]
+    if direction == "horizontal":
+        args.append("-h")
+    else:
+        args.append("-v")
+        
+    real_target = resolve_target(target_pane)
+    if real_target:
+        args.extend(["-t", real_target])
+        
+    if command:
+        args.append(command)
+    return args
+
+def select_window_args(target_window: str) -> list[str]:
+    # resolve_target might return session name if target_window was somehow None, but here it's required.
+    # But wait, if target_window is "1", resolve_target("1") -> "session:1". Correct.
+    return ["select-window", "-t", resolve_target(target_window)]
+
+def select_pane_args(target_pane: str) -> list[str]:
+    return ["select-pane", "-t", resolve_target(target_pane)]
+
+def kill_window_args(target_window: str) -> list[str]:
+    return ["kill-window", "-t", resolve_target(target_window)]
+
+def kill_pane_args(target_pane: str = None) -> list[str]:
+    args = ["kill-pane"]
+    real_target = resolve_target(target_pane)
+    if real_target:
+        args.extend(["-t", real_target])
+    return args
+
+BATCH_OPERATIONS = {
+    "new_window": new_window_args,
+    "rename_window": rename_window_args,
+    "send_keys": send_keys_args,
+    "split_window": split_window_args,
+    "select_window": select_window_args,
+    "select_pane": select_pane_args,
+    "kill_window": kill_window_args,
+    "kill_pane": kill_pane_args,
+}
+
+@mcp.tool()
+@offload
+def tmux_new_window(command: str, name: str = None, keep_open: bool = True, track_exit: bool = False) -> str:
+    """
+    Opens a new tmux window and runs the specified command.
+    With track_exit, returns a job id; use tmux_wait_command to get the exit code, runtime and output tail.
+    """
+    final_command = command
+    if track_exit:
+        job_id = uuid.uuid4().hex[:8]
+        job = {
+            "command": command,
+            "channel": f"mcptools-job-{job_id}",
+            "status_path": os.path.join(get_job_directory(), f"{job_id}.status"),
+        }
+        final_command = wrap_tracked_command(command, job["status_path"], job["channel"])
+
+    started = time.time()
+    output = None
+    # A tracked command would have its wrapper typed into the pooled shell, echoed into the pane
+    # (and so into the job's output tail) and kept in the shell history, so it gets its own window.
+    shell = None if track_exit else shell_pool.acquire()
+    if shell:
+        output = run_in_pooled_shell(shell, final_command, name, keep_open)
+    if output is None:
+        args = new_window_args(final_command, name, keep_open)
+        if track_exit:
+            args[1:1] = ["-P", "-F", "#{pane_id}"]
+        output = run_tmux_command(args)
+        if "Error" in output:
+            return output
+    message = f"Started command in new window{' ' + name if name else ''}: {command}"
+    if track_exit:
+        job.update(pane_id=output, started=started)
+        with _jobs_lock:
+            _jobs[job_id] = job
+        message += f" (job {job_id})"
+    return message
+
+@mcp.tool()
+async def tmux_wait_command(job_id: str, timeout: float = 60, tail_lines: int = 20) -> str:
+    """
+    Waits for a command started with tmux_new_window(track_exit=True) and returns its exit code,
+    runtime and the last tail_lines lines of output. Use timeout=0 to check the status without waiting.
+    Once the exit code has been returned the job id is released and cannot be waited for again.
+    """
+    # Waiting blocks on a tmux wait-for channel, so it runs outside the tool executor.
+    try:
+        return await asyncio.to_thread(wait_for_job, job_id, timeout, tail_lines)
+    except Exception as e:
+        return f"Error: {e}"
+
+@mcp.tool()
+@offload
+def tmux_rename_window(new_name: str, target_window: str = None) -> str:
+    """Renames a tmux window."""
+    output = run_tmux_command(rename_window_args(new_name, target_window))
     if "Error" in output:
         return output
     return f"Renamed window to '{new_name}'"
 
 @mcp.tool()
+@offload
 def tmux_send_keys(keys: str, target_pane: str = None) -> str:
     """Sends keys to a specific tmux pane."""
-    args = ["send-keys"]
-    real_target = resolve_target(target_pane)
-    if real_target:
-        args.extend(["-t", real_target])
-    
-    args.extend(shlex.split(keys))
-    
-    output = run_tmux_command(args)
+    output = run_tmux_command(send_keys_args(keys, target_pane))
     if "Error" in output:
         return output
     return f"Sent keys to pane {target_pane or 'current'}"
 
 @mcp.tool()
+@offload
+def tmux_broadcast_keys(keys: str, targets: list[str] = None, window: str = None, command: str = None) -> str:
+    """
+    Sends the same keys to many panes at once and returns a JSON result per pane.
+
+    Panes are the given targets or, without targets, every pane in window (or in the current
+    session), optionally only those whose current command contains `command`.
+    Keys are parsed as in tmux_send_keys.
+    """
+    try:
+        if not targets:
+            # Listed live: sending keys has side effects, so panes created since the cached
+            # topology was taken must not be skipped.
+            scope = ["-t", resolve_target(window)] if window else ["-s"]
+            if not window and current_session_target():
+                scope.extend(["-t", current_session_target()])
+            listing = run_tmux_command(["list-panes"] + scope + ["-F", list_format(PANE_FIELDS)])
+            if listing.startswith(("Tmux Error", "Error")):
+                return listing
+            targets = [
+                pane["pane_id"] for pane in without_pool_windows(parse_listing(listing, PANE_FIELDS))
+                if command is None or command in pane["pane_current_command"]
+            ]
+        if not targets:
+            return "No panes matched."
+
+        commands = [send_keys_args(keys, target) for target in targets]
+        replies = execute_tmux_batch(commands, stop_on_error=False)
+    except Exception as e:
+        return f"Error: {e}"
+
+    results = []
+    for target, reply in zip(targets, replies):
+        if reply is not None and reply[0]:
+            results.append({"target": target, "status": "ok"})
+        else:
+            results.append({"target": target, "status": "error", "error": reply[1].strip() if reply else "not sent"})
+    return json.dumps(results, indent=2)
+
+@mcp.tool()
+@offload
 def tmux_get_active_session_info() -> str:
     """Returns information about the current active tmux session."""
     args = ["display-message", "-p"]
@@ -180,69 +1531,187 @@ def tmux_get_active_session_info() -> str:
     return run_tmux_command(args)
 
 @mcp.tool()
-def tmux_capture_pane(target_pane: str = None, start_line: str = None, end_line: str = None) -> str:
-    """Captures text content from a tmux pane."""
-    args = ["capture-pane", "-p"]
+@offload
+def tmux_capture_pane(target_pane: str = None, start_line: str = None, end_line: str = None, since: str = None,
+                      max_lines: int = None, max_bytes: int = None, compact: bool = False,
+                      escape_sequences: bool = False, strip_ansi: bool = False, output_path: str = None) -> str:
+    """
+    Captures text content from a tmux pane.
+
+    With output_path, the capture is streamed into that file instead of being returned, and only the
+    path, byte and line counts and the last few lines are returned. Use this for long histories
+    (start_line="-"). since, max_lines, max_bytes and compact do not apply in this mode.
+
+    With `since`, returns only the lines completed since a previous capture instead, preceded by a
+    "[cursor ...]" line. Pass "0" the first time and the returned cursor afterwards. The cursor is
+    marked "reset" when the history was cleared or wrapped and the output restarts from the top.
+    start_line, end_line and escape_sequences are ignored in this mode.
+
+    max_lines and max_bytes bound the result, keeping the most recent lines. compact strips trailing
+    whitespace and collapses repeated lines (progress bars, spinners) into "×N" markers.
+    escape_sequences includes colours and attributes (-e); strip_ansi removes escape sequences from
+    the output, e.g. ones written by programs into delta captures.
+    """
     real_target = resolve_target(target_pane)
-    if real_target:
-        args.extend(["-t", real_target])
-        
-    if start_line is not None:
-        args.extend(["-S", str(start_line)])
-    if end_line is not None:
-        args.extend(["-E", str(end_line)])
-        
-    return run_tmux_command(args)
+    if since is not None and not output_path:
+        try:
+            header, *lines = capture_pane_delta(real_target, str(since)).split("\n")
+        except Exception as e:
+            return f"Error: {e}"
+        if not header.startswith("[cursor"):
+            return header
+    else:
+        args = ["capture-pane", "-p"]
+        if escape_sequences:
+            args.append("-e")
+        if real_target:
+            args.extend(["-t", real_target])
+            
+        if start_line is not None:
+            args.extend(["-S", str(start_line)])
+        if end_line is not None:
+            args.extend(["-E", str(end_line)])
+
+        if output_path:
+            try:
+                return capture_to_file(args, output_path)
+            except Exception as e:
+                return f"Error: {e}"
+
+        output = run_tmux_command(args)
+        if not (compact or strip_ansi or max_lines is not None or max_bytes is not None) or output.startswith(("Tmux Error", "Error")):
+            return output
+        header, lines = None, output.split("\n")
+
+    if compact:
+        lines = compact_lines(lines, strip_ansi)
+    elif strip_ansi:
+        lines = [ANSI_ESCAPE_RE.sub("", line) for line in lines]
+    if header is not None:
+        # The cursor line is part of the result, so it counts against the budget too.
+        if max_lines is not None:
+            max_lines = max(max_lines - 1, 0)
+        if max_bytes is not None:
+            max_bytes = max(max_bytes - len(header.encode("utf-8")) - 1, 0)
+    lines = apply_budget(lines, max_lines, max_bytes)
+    return "\n".join(lines if header is None else [header] + lines)
 
 @mcp.tool()
+@offload
 def tmux_split_window(target_pane: str = None, direction: str = "vertical", command: str = None) -> str:
     """Splits a window into two panes."""
-    args = ["split-window"]
-    if direction == "horizontal":
-        args.append("-h")
-    else:
-        args.append("-v")
-        
-    real_target = resolve_target(target_pane)
-    if real_target:
-        args.extend(["-t", real_target])
-        
-    if command:
-        args.append(command)
-        
-    output = run_tmux_command(args)
+    output = run_tmux_command(split_window_args(target_pane, direction, command))
     if "Error" in output:
         return output
     return "Split window successfully"
 
 @mcp.tool()
+@offload
 def tmux_select_window(target_window: str) -> str:
     """Selects (switches to) a specific window."""
-    real_target = resolve_target(target_window)
-    # resolve_target might return session name if target_window was somehow None, but here it's required.
-    # But wait, if target_window is "1", resolve_target("1") -> "session:1". Correct.
-    return run_tmux_command(["select-window", "-t", real_target])
+    return run_tmux_command(select_window_args(target_window))
 
 @mcp.tool()
+@offload
 def tmux_select_pane(target_pane: str) -> str:
     """Selects (focuses) a specific pane."""
-    real_target = resolve_target(target_pane)
-    return run_tmux_command(["select-pane", "-t", real_target])
+    return run_tmux_command(select_pane_args(target_pane))
 
 @mcp.tool()
+@offload
 def tmux_kill_window(target_window: str) -> str:
     """Kills (closes) a specific window."""
-    real_target = resolve_target(target_window)
-    return run_tmux_command(["kill-window", "-t", real_target])
+    return run_tmux_command(kill_window_args(target_window))
 
 @mcp.tool()
+@offload
 def tmux_kill_pane(target_pane: str = None) -> str:
     """Kills (closes) a specific pane."""
-    args = ["kill-pane"]
-    real_target = resolve_target(target_pane)
-    if real_target:
-        args.extend(["-t", real_target])
-    return run_tmux_command(args)
+    return run_tmux_command(kill_pane_args(target_pane))
+
+@mcp.tool()
+@offload
+def tmux_batch(operations: list[dict], stop_on_error: bool = True) -> str:
+    """
+    Runs several operations in one call and returns a JSON array with a result per operation.
+
+    Each operation is an object with an "op" key (new_window, split_window, rename_window, send_keys,
+    select_window, select_pane, kill_window, kill_pane) and the parameters of the matching tool,
+    e.g. {"op": "split_window", "target_pane": "build", "direction": "horizontal"}.
+    With stop_on_error, operations after the first failure are skipped.
+    """
+    commands = []
+    for index, operation in enumerate(operations):
+        params = dict(operation)
+        builder = BATCH_OPERATIONS.get(params.pop("op", None))
+        if builder is None:
+            return f"Error: Operation {index} has an unknown op '{operation.get('op')}'. Valid ops: {', '.join(BATCH_OPERATIONS)}"
+        try:
+            commands.append(builder(**params))
+        except (TypeError, ValueError) as e:
+            return f"Error: Operation {index} ({operation['op']}) is invalid: {e}"
+
+    try:
+        replies = execute_tmux_batch(commands, stop_on_error)
+    except Exception as e:
+        return f"Error: {e}"
+
+    results = []
+    for index, (operation, reply) in enumerate(zip(operations, replies)):
+        result = {"index": index, "op": operation["op"]}
+        if reply is None:
+            result["status"] = "skipped"
+        elif reply[0]:
+            result.update(status="ok", output=reply[1].strip())
+        else:
+            result.update(status="error", error=reply[1].strip())
+        results.append(result)
+    return json.dumps(results, indent=2)
+
+@mcp.tool()
+@offload
+def tmux_search_panes(pattern: str, scope: str = None, max_results: int = 50, context_lines: int = 2,
+                      history: bool = True, ignore_case: bool = False) -> str:
+    """
+    Searches the scrollback of many panes for a regular expression and returns JSON matches with
+    pane id, window, line number and surrounding lines.
+
+    scope is None for the current session, "all" for every session, or a window target.
+    history=False searches only the visible part of each pane. Stops after max_results matches.
+    """
+    try:
+        regex = re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+    except re.error as e:
+        return f"Error: Invalid pattern '{pattern}': {e}"
+
+    try:
+        if scope is None:
+            panes = list_session_panes()
+        elif scope == "all":
+            panes = list_pane_topology(["-a"])
+        else:
+            panes = list_pane_topology(["-t", resolve_target(scope)])
+        result = search_panes(regex, without_pool_windows(panes), history, max_results, context_lines)
+    except Exception as e:
+        return f"Error: {e}"
+    return json.dumps(result, indent=2)
+
+@mcp.tool()
+async def tmux_wait_for_output(pattern: str, target_pane: str = None, timeout: float = 60, context_lines: int = 5) -> str:
+    """
+    Waits until new output in a pane matches a regular expression, then returns the matching line
+    with up to context_lines lines before it. Each line is matched separately, with escape sequences removed.
+    Use this instead of polling tmux_capture_pane while a command runs.
+    """
+    def wait():
+        return wait_for_output(resolve_target(target_pane), pattern, timeout, context_lines)
+
+    # Waiting does not use tmux, so it runs outside the tool executor and cannot starve other calls.
+    try:
+        return await asyncio.to_thread(wait)
+    except Exception as e:
+        return f"Error: {e}"
 
 if __name__ == "__main__":
+    shell_pool.start()
     mcp.run(show_banner=False)
\ No newline at end of file